@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Client defaults, overridable through the environment
+CONNECT_TIMEOUT = float(os.environ.get("ADK_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.environ.get("ADK_READ_TIMEOUT", 120))
+POOL_MAXSIZE = int(os.environ.get("ADK_POOL_MAXSIZE", 32))
+MAX_RETRIES = int(os.environ.get("ADK_MAX_RETRIES", 3))
+RETRY_BACKOFF = float(os.environ.get("ADK_RETRY_BACKOFF", 0.3))
+
+# Only idempotent calls are retried once the request has reached the server
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "DELETE"})
+RETRY_STATUSES = (502, 503, 504)
+
+# Number of recent samples kept per endpoint for percentile estimates
+LATENCY_WINDOW = 512
+
+
+class EndpointStats:
+    """Latency counters for a single endpoint"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, seconds: float, error: bool) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.recent.append(seconds)
+        if error:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self.recent)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(1000 * self.total_seconds / self.count, 1) if self.count else 0.0,
+            "p50_ms": round(1000 * percentile(0.50), 1),
+            "p99_ms": round(1000 * percentile(0.99), 1),
+            "max_ms": round(1000 * self.max_seconds, 1),
+        }
+
+
+class AdkClient:
+    """Pooled, keep-alive HTTP client for the ADK API server.
+
+    One instance is meant to be shared by every session of a process, so
+    connections to the server are reused across reruns and chat tabs.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        pool_maxsize: int = POOL_MAXSIZE,
+        max_retries: int = MAX_RETRIES,
+        backoff_factor: float = RETRY_BACKOFF,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._stats: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+        """Send a request and record its latency under the given endpoint label.
+
+        For streamed responses the latency covers the time until the response
+        headers arrive, not the whole stream.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        error = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            error = response.status_code >= 500
+            return response
+        finally:
+            self._record(f"{method} {endpoint}", time.perf_counter() - start, error)
+
+    def list_apps(self, server_url: str) -> requests.Response:
+        return self.request("GET", f"{server_url}/list-apps", "/list-apps")
+
+    def create_session(
+        self, server_url: str, app_name: str, user_id: str, session_id: str, state: Optional[Dict] = None
+    ) -> requests.Response:
+        return self.request(
+            "POST",
+            self._session_url(server_url, app_name, user_id, session_id),
+            "/apps/{app}/users/{user}/sessions/{session}",
+            json=state or {},
+        )
+
+    def get_session(self, server_url: str, app_name: str, user_id: str, session_id: str) -> requests.Response:
+        return self.request(
+            "GET",
+            self._session_url(server_url, app_name, user_id, session_id),
+            "/apps/{app}/users/{user}/sessions/{session}",
+        )
+
+    def update_session_state(
+        self, server_url: str, app_name: str, user_id: str, session_id: str, state_delta: Dict
+    ) -> requests.Response:
+        return self.request(
+            "PATCH",
+            self._session_url(server_url, app_name, user_id, session_id),
+            "/apps/{app}/users/{user}/sessions/{session}",
+            json=state_delta,
+        )
+
+    def delete_session(self, server_url: str, app_name: str, user_id: str, session_id: str) -> requests.Response:
+        return self.request(
+            "DELETE",
+            self._session_url(server_url, app_name, user_id, session_id),
+            "/apps/{app}/users/{user}/sessions/{session}",
+        )
+
+    def list_app_sessions(
+        self,
+        server_url: str,
+        app_name: str,
+        user_ids: Optional[List[str]] = None,
+        older_than: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> requests.Response:
+        """One page of an app's sessions across users; follow the response's next_cursor"""
+        params = {"user_id": user_ids, "older_than": older_than, "cursor": cursor, "limit": limit}
+        return self.request(
+            "GET", f"{server_url}/apps/{app_name}/sessions", "/apps/{app}/sessions",
+            params={key: value for key, value in params.items() if value is not None},
+        )
+
+    def batch_create_sessions(
+        self,
+        server_url: str,
+        app_name: str,
+        user_ids: Optional[List[str]] = None,
+        session_id: Optional[str] = None,
+        state: Optional[Dict] = None,
+    ) -> requests.Response:
+        """Create a session per user (every profile when user_ids is None); streams NDJSON progress"""
+        return self.request(
+            "POST",
+            f"{server_url}/apps/{app_name}/sessions/batch_create",
+            "/apps/{app}/sessions/batch_create",
+            json={"user_ids": user_ids, "session_id": session_id, "state": state or {}},
+            stream=True,
+        )
+
+    def batch_delete_sessions(
+        self, server_url: str, app_name: str, user_ids: Optional[List[str]] = None, older_than: Optional[float] = None
+    ) -> requests.Response:
+        """Delete the sessions of these users and/or idle this many seconds; streams NDJSON progress"""
+        return self.request(
+            "POST",
+            f"{server_url}/apps/{app_name}/sessions/batch_delete",
+            "/apps/{app}/sessions/batch_delete",
+            json={"user_ids": user_ids, "older_than": older_than},
+            stream=True,
+        )
+
+    def run(self, server_url: str, request_data: Dict) -> requests.Response:
+        return self.request("POST", f"{server_url}/run", "/run", json=request_data)
+
+    def run_sse(self, server_url: str, request_data: Dict, last_event_id: Optional[str] = None) -> requests.Response:
+        """Start an agent run, or resume the one that sent last_event_id after that event"""
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else None
+        return self.request(
+            "POST", f"{server_url}/run_sse", "/run_sse", json=request_data, headers=headers, stream=True
+        )
+
+    def cancel_run_sse(self, server_url: str, stream_id: str) -> requests.Response:
+        return self.request("DELETE", f"{server_url}/run_sse/{stream_id}", "/run_sse/{stream}")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Return one row of latency counters per endpoint"""
+        with self._lock:
+            return [
+                {"endpoint": endpoint, **stats.snapshot()}
+                for endpoint, stats in sorted(self._stats.items())
+            ]
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _record(self, endpoint: str, seconds: float, error: bool) -> None:
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats()
+            stats.record(seconds, error)
+
+    @staticmethod
+    def _session_url(server_url: str, app_name: str, user_id: str, session_id: str) -> str:
+        return f"{server_url}/apps/{app_name}/users/{user_id}/sessions/{session_id}"
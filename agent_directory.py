@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from adk_client import AdkClient
+
+# Seconds before a cached agent list is refreshed in the background
+AGENT_LIST_TTL = float(os.environ.get("ADK_AGENT_LIST_TTL", 60))
+
+
+class _Entry:
+    """Cached /list-apps result for one server"""
+
+    def __init__(self):
+        self.agents: Optional[List[str]] = None
+        self.checked_at = 0.0
+        self.refreshing = False
+        self.error: Optional[str] = None
+
+
+class AgentDirectory:
+    """TTL cache of available agents, keyed by server URL.
+
+    Stale entries are still served while a single background thread refreshes
+    them, so a slow or restarting server never blocks a page render once the
+    first list has been fetched. Until then a failed fetch is only retried
+    after `ttl` seconds (or an explicit refresh); in between its error is
+    raised again without contacting the server.
+    """
+
+    def __init__(self, client: AdkClient, ttl: float = AGENT_LIST_TTL):
+        self.client = client
+        self.ttl = ttl
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def get(self, server_url: str) -> List[str]:
+        """Return the cached agent list, fetching it only on first use"""
+        with self._lock:
+            entry = self._entries.setdefault(server_url, _Entry())
+            agents = entry.agents
+            stale = time.monotonic() - entry.checked_at >= self.ttl
+            if agents is None and entry.error is not None and not stale:
+                raise RuntimeError(entry.error)
+            if agents is not None and stale and not entry.refreshing:
+                entry.refreshing = True
+                threading.Thread(
+                    target=self._refresh_in_background, args=(server_url,), daemon=True
+                ).start()
+
+        if agents is None:
+            return self.refresh(server_url)
+        return agents
+
+    def refresh(self, server_url: str) -> List[str]:
+        """Fetch the agent list now and update the cache"""
+        try:
+            response = self.client.list_apps(server_url)
+            response.raise_for_status()
+            agents = response.json()
+        except Exception as e:
+            with self._lock:
+                entry = self._entries.setdefault(server_url, _Entry())
+                entry.checked_at = time.monotonic()
+                entry.error = str(e)
+            raise
+
+        with self._lock:
+            entry = self._entries.setdefault(server_url, _Entry())
+            entry.agents = agents
+            entry.checked_at = time.monotonic()
+            entry.error = None
+        return agents
+
+    def last_error(self, server_url: str) -> Optional[str]:
+        """Return the error from the most recent failed fetch, if any"""
+        with self._lock:
+            entry = self._entries.get(server_url)
+            return entry.error if entry else None
+
+    def _refresh_in_background(self, server_url: str) -> None:
+        try:
+            self.refresh(server_url)
+        except Exception:
+            pass  # Keep serving the stale list; the error is kept on the entry
+        finally:
+            with self._lock:
+                self._entries[server_url].refreshing = False
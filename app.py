@@ -1,9 +1,26 @@
 import streamlit as st
-import requests
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 import time
 import os
+import queue
+from typing import Dict
+
+from adk_client import AdkClient
+from chat_history import (
+    CHAT_KEEP_RAW_EVENTS,
+    CHAT_RAW_STORE_MB,
+    RawEventStore,
+    history_start,
+    make_message,
+    render_history,
+    render_message,
+    reset_history_window,
+)
+from agent_directory import AgentDirectory
+from chat_turns import CANCELLED, CHAT_POLL_INTERVAL, DONE, TurnRunner
+from streaming import STREAM_REDRAW_INTERVAL
+from profile_store import ProfileStore, create_profile_store
 
 # Page configuration
 st.set_page_config(
@@ -37,17 +54,32 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Shared HTTP client, created once per Streamlit server process
+@st.cache_resource
+def get_adk_client() -> AdkClient:
+    """Get the pooled ADK API client shared by all sessions"""
+    return AdkClient()
+
+# Agent list cache shared by all sessions of this process
+@st.cache_resource
+def get_agent_directory() -> AgentDirectory:
+    """Get the TTL-cached directory of agents per server URL"""
+    return AgentDirectory(get_adk_client())
+
+# Agent calls run on a bounded pool shared by all sessions of this process
+@st.cache_resource
+def get_turn_runner() -> TurnRunner:
+    """Get the background runner for chat turns"""
+    return TurnRunner(get_adk_client())
+
 # Function to get available agents
-def get_available_agents():
+def get_available_agents(server_url):
     """Get list of available agents from subdirectories"""
-
-    server_url="http://localhost:8080"
-    response = requests.get(
-                    f"{server_url}/list-apps",
-                    headers={"Content-Type": "application/json"}
-                )
-    agent_list = response.json()
-    return agent_list
+    try:
+        return get_agent_directory().get(server_url)
+    except Exception as e:
+        st.error(f"❌ Could not load agents from {server_url}: {str(e)}")
+        return []
 
 # Initialize session state
 if 'messages' not in st.session_state:
@@ -62,6 +94,23 @@ if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
 if 'username' not in st.session_state:
     st.session_state.username = ""
+# Session and state last sent to the server, so updates only send what changed
+if 'synced_session' not in st.session_state:
+    st.session_state.synced_session = None
+    st.session_state.synced_state = {}
+# Agent turn running in the background, and what to report once it has finished
+if 'pending_turn' not in st.session_state:
+    st.session_state.pending_turn = None
+if 'turn_notices' not in st.session_state:
+    st.session_state.turn_notices = []
+# Comparison mode: finished rounds, and the round whose agents are still answering
+if 'compare_history' not in st.session_state:
+    st.session_state.compare_history = []
+    st.session_state.pending_comparison = None
+# Bulk session admin: cursors of the session list pages visited so far, and the page shown
+if 'admin_cursors' not in st.session_state:
+    st.session_state.admin_cursors = [None]
+    st.session_state.admin_page = None
 
 # Default credentials (for demo purposes)
 DEFAULT_CREDENTIALS = {
@@ -70,23 +119,380 @@ DEFAULT_CREDENTIALS = {
     "test": "test123"
 }
 
-# Function to load initial state from mock_database.json
+# Users who see the bulk session admin panel
+ADMIN_USERS = set(os.environ.get("ADMIN_USERS", "admin").split(","))
+
+# Compressed store for raw agent events, shared by all sessions of this process
+@st.cache_resource
+def get_raw_event_store():
+    """Get the raw event store, or None when raw events are not kept"""
+    if not CHAT_KEEP_RAW_EVENTS:
+        return None
+    return RawEventStore(int(CHAT_RAW_STORE_MB * 1024 * 1024))
+
+# User profile store shared by all sessions of this process
+@st.cache_resource
+def get_profile_store() -> ProfileStore:
+    """Get the configured user profile store (mock_database.json by default)"""
+    return create_profile_store()
+
+def diff_state(baseline: Dict, new: Dict, server_state: Dict) -> Dict:
+    """Keys added or changed in the text area since `baseline` that differ on the server,
+    plus keys removed from it set to None. Keys the UI never set, such as those written
+    by the agent, and server-side changes to keys left unedited are not touched."""
+    missing = object()
+    delta = {
+        key: value for key, value in new.items()
+        if baseline.get(key, missing) != value and server_state.get(key, missing) != value
+    }
+    delta.update({key: None for key in baseline if key not in new and server_state.get(key) is not None})
+    return delta
+
+# Function to load initial state from the user profile store
 def load_initial_state(user_id):
-    """Load initial session state for the logged-in user from mock_database.json."""
+    """Load initial session state for the logged-in user from the profile store."""
     
-    mock_db_path = os.path.join(os.getcwd(), "mock_database.json")
-    if os.path.exists(mock_db_path):
-        try:
-            with open(mock_db_path, "r") as file:
-                data = json.load(file)
-                for user in data.get("users", []):
-                    if user.get("user_id") == user_id:
-                        return user
-        except json.JSONDecodeError:
-            st.error("❌ Invalid JSON format in mock_database.json")
-        except Exception as e:
-            st.error(f"❌ Error reading mock_database.json: {str(e)}")
-    return {}  # Return empty dict if file doesn't exist or no match found
+    try:
+        return get_profile_store().get(user_id)
+    except json.JSONDecodeError:
+        st.error("❌ Invalid JSON format in the user profile file")
+    except Exception as e:
+        st.error(f"❌ Error reading user profiles: {str(e)}")
+    return {}  # Return empty dict if the store is unreadable
+
+def parse_user_ids(text: str):
+    """User ids entered one per line or comma-separated, or None when there are none"""
+    user_ids = [user_id.strip() for line in text.splitlines() for user_id in line.split(",") if user_id.strip()]
+    return user_ids or None
+
+def show_bulk_progress(response, label):
+    """Show the NDJSON progress of a bulk session operation as it streams in"""
+    if response.status_code != 200:
+        st.error(f"❌ {label} failed: {response.text}")
+        return
+    progress_bar = st.progress(0.0, text=label)
+    progress = {}
+    for line in response.iter_lines():
+        if not line:
+            continue
+        progress = json.loads(line)
+        total = progress.get("total", 0)
+        progress_bar.progress(
+            min(1.0, progress["done"] / total) if total else 1.0,
+            text=f"{label}: {progress['done']}/{total}"
+        )
+    counts = ", ".join(f"{progress[key]} {key}" for key in ("created", "skipped", "deleted") if key in progress)
+    if progress.get("status") == "complete":
+        st.success(f"✅ {label} finished: {counts}")
+    else:
+        st.error(f"❌ {label} stopped after {counts}: {progress.get('error', 'stream ended early')}")
+
+def show_session_admin(server_url, agent_name):
+    """Bulk create, delete and list the selected agent's sessions across users"""
+    client = get_adk_client()
+    operation = st.radio("Operation", ["Create", "Delete", "List"], horizontal=True, key="admin_operation")
+    
+    if operation == "Create":
+        user_ids = st.text_area(
+            "User IDs",
+            key="admin_create_users",
+            help="One per line or comma-separated; leave empty for every user in the profile store"
+        )
+        session_id = st.text_input(
+            "Session ID",
+            key="admin_create_session",
+            help="The same session ID for every user; leave empty for a new one per user"
+        )
+        if st.button("➕ Create Sessions", type="primary"):
+            try:
+                response = client.batch_create_sessions(
+                    server_url, agent_name, parse_user_ids(user_ids), session_id.strip() or None
+                )
+                show_bulk_progress(response, "Create sessions")
+                reset_session_pages()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+    
+    elif operation == "Delete":
+        user_ids = parse_user_ids(st.text_area(
+            "User IDs",
+            key="admin_delete_users",
+            help="One per line or comma-separated; leave empty for all users"
+        ))
+        idle_hours = st.number_input(
+            "Idle for at least (hours)",
+            min_value=0.0,
+            value=0.0,
+            key="admin_delete_idle",
+            help="Only sessions not updated for this long; 0 for any age"
+        )
+        older_than = idle_hours * 3600 if idle_hours > 0 else None
+        if user_ids is None and older_than is None:
+            st.caption("Give user IDs, an idle time or both.")
+        confirmed = st.checkbox("I understand the sessions can't be restored", key="admin_delete_confirm")
+        if st.button(
+            "🗑️ Delete Sessions",
+            disabled=not confirmed or (user_ids is None and older_than is None)
+        ):
+            try:
+                response = client.batch_delete_sessions(server_url, agent_name, user_ids, older_than)
+                show_bulk_progress(response, "Delete sessions")
+                reset_session_pages()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+    
+    else:
+        user_ids = parse_user_ids(st.text_input(
+            "User IDs",
+            key="admin_list_users",
+            on_change=reset_session_pages,
+            help="Comma-separated; leave empty for all users"
+        ))
+        page_size = st.selectbox("Page size", [25, 100, 500], key="admin_page_size", on_change=reset_session_pages)
+        cursors = st.session_state.admin_cursors
+        page = st.session_state.admin_page
+        # Pages are only fetched on a click, not on every rerun of the app
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            load_clicked = st.button("🔍 Load")
+        with col2:
+            previous_clicked = st.button("⬅️", disabled=len(cursors) < 2, help="Previous page")
+        with col3:
+            next_clicked = st.button("➡️", disabled=page is None or page["next_cursor"] is None, help="Next page")
+        
+        if load_clicked or previous_clicked or next_clicked:
+            if load_clicked:
+                cursors[:] = [None]
+            elif previous_clicked:
+                cursors.pop()
+            else:
+                cursors.append(page["next_cursor"])
+            try:
+                response = client.list_app_sessions(
+                    server_url, agent_name, user_ids, cursor=cursors[-1], limit=page_size
+                )
+                if response.status_code == 200:
+                    st.session_state.admin_page = page = response.json()
+                    st.rerun()
+                else:
+                    st.error(f"❌ Failed to list sessions: {response.text}")
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+        
+        if page is not None:
+            st.caption(f"Page {len(cursors)}, {len(page['sessions'])} sessions")
+            st.dataframe(
+                [
+                    {
+                        "user_id": session["user_id"],
+                        "session_id": session["id"],
+                        "last_update": datetime.fromtimestamp(
+                            session["last_update_time"], timezone.utc
+                        ).strftime("%Y-%m-%d %H:%M UTC"),
+                    }
+                    for session in page["sessions"]
+                ],
+                hide_index=True
+            )
+
+def reset_session_pages():
+    """Forget the listed sessions, e.g. after the filter changed or sessions were deleted"""
+    st.session_state.admin_cursors = [None]
+    st.session_state.admin_page = None
+
+def cancel_pending_turn():
+    """Stop the in-flight agent turns of this session, if any"""
+    if st.session_state.pending_turn is not None:
+        st.session_state.pending_turn.cancel()
+        st.session_state.pending_turn = None
+    if st.session_state.pending_comparison is not None:
+        for turn in st.session_state.pending_comparison["turns"].values():
+            turn.cancel()
+        st.session_state.pending_comparison = None
+
+def show_pending_turn():
+    """Draw the in-flight agent turn, redrawn often enough for streamed text to flow"""
+    if st.session_state.pending_turn.streaming:
+        stream_pending_turn()
+    else:
+        poll_pending_turn()
+
+@st.fragment(run_every=STREAM_REDRAW_INTERVAL)
+def stream_pending_turn():
+    draw_pending_turn()
+
+@st.fragment(run_every=CHAT_POLL_INTERVAL)
+def poll_pending_turn():
+    draw_pending_turn()
+
+def draw_pending_turn():
+    """Draw the in-flight agent turn's progress, moving it into the history once it finishes"""
+    turn = st.session_state.pending_turn
+    if turn is None:
+        return
+    
+    if turn.finished:
+        # Move the answer into the history and redraw the whole page
+        st.session_state.pending_turn = None
+        if turn.status == DONE:
+            st.session_state.messages.append(make_message("assistant", turn.events, get_raw_event_store()))
+        elif turn.status == CANCELLED:
+            st.session_state.turn_notices.append(("info", "⏹️ The agent turn was cancelled."))
+        st.session_state.turn_notices.extend(("error", f"❌ Error: {error}") for error in turn.errors)
+        st.rerun()
+    
+    with st.chat_message("assistant"):
+        text = turn.text
+        if text:
+            st.markdown(text + "▌")
+        else:
+            st.caption("🤔 Agent is thinking...")
+    if st.button("⏹️ Cancel", key="cancel_turn"):
+        cancel_pending_turn()
+        st.session_state.turn_notices.append(("info", "⏹️ The agent turn was cancelled."))
+        st.rerun()
+
+def format_timing(time_to_first_token, total):
+    """Latency caption shown above each agent's answer in comparison mode"""
+    first = f"{time_to_first_token:.2f}s" if time_to_first_token is not None else "–"
+    return f"⏱️ First token: {first} · Total: {total:.2f}s"
+
+def render_comparison_round(comparison_round, raw_store=None):
+    """Draw one prompt and every agent's answer side by side"""
+    render_message(comparison_round["prompt"])
+    replies = comparison_round["replies"]
+    for column, (agent, reply) in zip(st.columns(len(replies)), replies.items()):
+        with column:
+            st.markdown(f"**{agent}**")
+            st.caption(format_timing(reply["time_to_first_token"], reply["total"]))
+            if reply["message"] is not None:
+                render_message(reply["message"], raw_store)
+            elif reply["status"] == CANCELLED:
+                st.info("⏹️ Cancelled")
+            for error in reply["errors"]:
+                st.error(f"❌ Error: {error}")
+
+def show_pending_comparison():
+    """Draw the agents answering the current comparison round, at the streaming rate if they stream"""
+    if st.session_state.pending_comparison["streaming"]:
+        stream_pending_comparison()
+    else:
+        poll_pending_comparison()
+
+@st.fragment(run_every=STREAM_REDRAW_INTERVAL)
+def stream_pending_comparison():
+    draw_pending_comparison()
+
+@st.fragment(run_every=CHAT_POLL_INTERVAL)
+def poll_pending_comparison():
+    draw_pending_comparison()
+
+def draw_pending_comparison():
+    """Draw each agent's answer of the current comparison round in its own column"""
+    pending = st.session_state.pending_comparison
+    if pending is None:
+        return
+    turns = pending["turns"]
+    
+    if all(turn.finished for turn in turns.values()):
+        # Move the answers into the comparison history and redraw the whole page
+        raw_store = get_raw_event_store()
+        st.session_state.compare_history.append({
+            "prompt": pending["prompt"],
+            "replies": {
+                agent: {
+                    "message": make_message("assistant", turn.events, raw_store) if turn.status == DONE else None,
+                    "status": turn.status,
+                    "errors": turn.errors,
+                    "time_to_first_token": turn.time_to_first_token,
+                    "total": turn.elapsed,
+                }
+                for agent, turn in turns.items()
+            },
+        })
+        st.session_state.pending_comparison = None
+        st.rerun()
+    
+    for column, (agent, turn) in zip(st.columns(len(turns)), turns.items()):
+        with column:
+            st.markdown(f"**{agent}**")
+            st.caption(format_timing(turn.time_to_first_token, turn.elapsed))
+            with st.chat_message("assistant"):
+                text = turn.text
+                if text:
+                    st.markdown(text if turn.finished else text + "▌")
+                elif turn.finished:
+                    st.caption("Done.")
+                else:
+                    st.caption("🤔 Agent is thinking...")
+    if st.button("⏹️ Cancel", key="cancel_comparison"):
+        cancel_pending_turn()
+        st.session_state.turn_notices.append(("info", "⏹️ The comparison was cancelled."))
+        st.rerun()
+
+def show_comparison(server_url, agents, initial_state, use_streaming, show_raw_events):
+    """Send each message to several agents at once and show their answers side by side"""
+    st.info("🔀 Comparison mode: each agent answers in its own session, created on first use.")
+    st.subheader("💬 Comparison History")
+    
+    raw_store = get_raw_event_store()
+    compare_history = st.session_state.compare_history
+    start = history_start(len(compare_history), "compare_history_limit", "comparisons")
+    for comparison_round in compare_history[start:]:
+        render_comparison_round(comparison_round, raw_store if show_raw_events else None)
+    
+    for kind, notice in st.session_state.turn_notices:
+        if kind == "error":
+            st.error(notice)
+        else:
+            st.info(notice)
+    st.session_state.turn_notices = []
+    
+    if st.session_state.pending_comparison is not None:
+        render_message(st.session_state.pending_comparison["prompt"])
+        show_pending_comparison()
+    
+    user_input = st.chat_input(
+        "Type a message for the selected agents...",
+        disabled=st.session_state.pending_comparison is not None
+    )
+    if not user_input:
+        return
+    if not agents:
+        st.error("⚠️ Please select at least one agent to compare!")
+        return
+    try:
+        state_data = json.loads(initial_state) if initial_state.strip() else {}
+    except json.JSONDecodeError:
+        st.error("❌ Invalid JSON format for initial state")
+        return
+    
+    # One turn per agent on the shared runner, so the wait is that of the slowest agent
+    turns = {}
+    try:
+        for agent in agents:
+            request_data = {
+                "app_name": agent,
+                "user_id": st.session_state.user_id,
+                "session_id": st.session_state.session_id,
+                "new_message": {
+                    "role": "user",
+                    "parts": [{"text": user_input}]
+                },
+                "streaming": use_streaming,
+            }
+            turns[agent] = get_turn_runner().submit(server_url, request_data, True, initial_state=state_data)
+    except queue.Full:
+        for turn in turns.values():
+            turn.cancel()
+        st.error("❌ Too many agent turns are running right now. Please try again in a moment.")
+        return
+    st.session_state.pending_comparison = {
+        "prompt": make_message("user", user_input),
+        "turns": turns,
+        "streaming": use_streaming,
+    }
+    st.rerun()
 
 def show_login_page():
     """Display the login page"""
@@ -147,9 +553,12 @@ def show_main_app():
         
         if st.button("🚪 Logout", type="secondary"):
             # Clear authentication and reset session
+            cancel_pending_turn()
             st.session_state.authenticated = False
             st.session_state.username = ""
             st.session_state.messages = []
+            st.session_state.compare_history = []
+            reset_history_window()
             st.session_state.session_created = False
             st.rerun()
         
@@ -165,7 +574,15 @@ def show_main_app():
         
         # Agent configuration
         st.subheader("Agent Settings")
-        available_agents = get_available_agents()
+        if st.button("🔁 Refresh Agent List"):
+            try:
+                get_agent_directory().refresh(server_url)
+            except Exception as e:
+                st.error(f"❌ Failed to refresh agents: {str(e)}")
+        available_agents = get_available_agents(server_url)
+        refresh_error = get_agent_directory().last_error(server_url)
+        if refresh_error and available_agents:
+            st.caption(f"⚠️ Showing cached agents, last refresh failed: {refresh_error}")
         
         # Set default agent
         default_index = 0
@@ -180,6 +597,21 @@ def show_main_app():
         # Display selected agent info
         st.info(f"📁 Selected Agent Directory: `{agent_name}`")
         
+        # Comparison mode sends each message to several agents at once
+        compare_mode = st.checkbox(
+            "Compare Agents",
+            value=False,
+            help="Send each message to several agents concurrently, each in its own session"
+        )
+        compare_agents = []
+        if compare_mode:
+            compare_agents = st.multiselect(
+                "Agents to Compare",
+                options=available_agents,
+                default=[agent_name] if agent_name else [],
+                help="Every selected agent answers each message side by side"
+            )
+        
         # Session configuration
         st.subheader("Session Settings")
         col1, col2 = st.columns(2)
@@ -213,6 +645,15 @@ def show_main_app():
             help="Enable token-level streaming for responses"
         )
         
+        # Raw event display, only offered when raw events are kept
+        show_raw_events = False
+        if get_raw_event_store() is not None:
+            show_raw_events = st.checkbox(
+                "Show Raw Events",
+                value=False,
+                help="Show the raw ADK events behind each agent reply"
+            )
+        
         st.markdown("---")
         
         # Session management buttons
@@ -226,20 +667,52 @@ def show_main_app():
                 if initial_state.strip():
                     state_data = json.loads(initial_state)
                 
-                # Create session
-                response = requests.post(
-                    f"{server_url}/apps/{agent_name}/users/{st.session_state.user_id}/sessions/{st.session_state.session_id}",
-                    headers={"Content-Type": "application/json"},
-                    json=state_data
-                )
+                client = get_adk_client()
+                session_key = (server_url, agent_name, st.session_state.user_id, st.session_state.session_id)
+                # What the text area held before this edit: the state last sent, or the profile it was loaded with
+                baseline = st.session_state.synced_state if st.session_state.synced_session == session_key else user_data
                 
-                if response.status_code == 200:
-                    st.session_state.session_created = True
-                    st.success(f"✅ Session created/updated successfully!")
-                    session_info = response.json()
-                    st.json(session_info)
+                # Create the session, or send only the fields edited here that differ from the server's current state
+                response = None
+                existing = client.get_session(
+                    server_url, agent_name, st.session_state.user_id, st.session_state.session_id
+                )
+                if existing.status_code == 404:
+                    response = client.create_session(
+                        server_url,
+                        agent_name,
+                        st.session_state.user_id,
+                        st.session_state.session_id,
+                        state_data
+                    )
+                elif existing.status_code != 200:
+                    st.error(f"❌ Failed to get session: {existing.text}")
                 else:
-                    st.error(f"❌ Failed to create session: {response.text}")
+                    state_delta = diff_state(baseline, state_data, existing.json().get("state", {}))
+                    if not state_delta:
+                        st.session_state.session_created = True
+                        st.session_state.synced_session = session_key
+                        st.session_state.synced_state = state_data
+                        st.info("ℹ️ Session state is already up to date")
+                    else:
+                        response = client.update_session_state(
+                            server_url,
+                            agent_name,
+                            st.session_state.user_id,
+                            st.session_state.session_id,
+                            state_delta
+                        )
+                
+                if response is not None:
+                    if response.status_code == 200:
+                        st.session_state.session_created = True
+                        st.session_state.synced_session = session_key
+                        st.session_state.synced_state = state_data
+                        st.success(f"✅ Session created/updated successfully!")
+                        session_info = response.json()
+                        st.json(session_info)
+                    else:
+                        st.error(f"❌ Failed to create session: {response.text}")
             except json.JSONDecodeError:
                 st.error("❌ Invalid JSON format for initial state")
             except Exception as e:
@@ -248,8 +721,11 @@ def show_main_app():
         # Get session info button
         if st.button("ℹ️ Get Session Info"):
             try:
-                response = requests.get(
-                    f"{server_url}/apps/{agent_name}/users/{st.session_state.user_id}/sessions/{st.session_state.session_id}"
+                response = get_adk_client().get_session(
+                    server_url,
+                    agent_name,
+                    st.session_state.user_id,
+                    st.session_state.session_id
                 )
                 
                 if response.status_code == 200:
@@ -264,13 +740,19 @@ def show_main_app():
         # Delete session button
         if st.button("🗑️ Delete Session"):
             try:
-                response = requests.delete(
-                    f"{server_url}/apps/{agent_name}/users/{st.session_state.user_id}/sessions/{st.session_state.session_id}"
+                response = get_adk_client().delete_session(
+                    server_url,
+                    agent_name,
+                    st.session_state.user_id,
+                    st.session_state.session_id
                 )
                 
-                if response.status_code == 204:
+                if response.status_code in (200, 204):
+                    cancel_pending_turn()
                     st.session_state.session_created = False
+                    st.session_state.synced_session = None
                     st.session_state.messages = []
+                    reset_history_window()
                     st.success("✅ Session deleted successfully!")
                     st.rerun()
                 else:
@@ -280,29 +762,48 @@ def show_main_app():
         
         # Clear chat button
         if st.button("🧹 Clear Chat History"):
+            cancel_pending_turn()
             st.session_state.messages = []
+            st.session_state.compare_history = []
+            reset_history_window()
             st.rerun()
         
+        # Bulk operations on every user's sessions of the selected agent
+        if st.session_state.username in ADMIN_USERS:
+            st.markdown("---")
+            st.subheader("Session Admin")
+            with st.expander("🗄️ Bulk Session Operations"):
+                show_session_admin(server_url, agent_name)
+        
         st.markdown("---")
         
         # Available agents list
         st.subheader("Available Agents")
         if st.button("📋 List All Agents"):
             try:
-                response = requests.get(f"{server_url}/list-apps")
-                if response.status_code == 200:
-                    agents = response.json()
-                    st.success("✅ Agents retrieved successfully!")
-                    for agent in agents.get('apps', []):
-                        st.info(f"• {agent}")
-                else:
-                    st.error(f"❌ Failed to list agents: {response.text}")
+                agents = get_agent_directory().refresh(server_url)
+                st.success("✅ Agents retrieved successfully!")
+                for agent in agents:
+                    st.info(f"• {agent}")
             except Exception as e:
-                st.error(f"❌ Error: {str(e)}")
+                st.error(f"❌ Failed to list agents: {str(e)}")
+        
+        # Client-side latency counters for calls to the API server
+        with st.expander("📈 API Client Latency"):
+            client_stats = get_adk_client().stats()
+            if client_stats:
+                st.table(client_stats)
+            else:
+                st.caption("No requests recorded yet.")
     
     # Main chat interface
     main_container = st.container()
     
+    if compare_mode:
+        with main_container:
+            show_comparison(server_url, compare_agents, initial_state, use_streaming, show_raw_events)
+        return
+    
     with main_container:
         # Session status indicator
         if st.session_state.session_created:
@@ -313,45 +814,33 @@ def show_main_app():
         # Chat history display
         st.subheader("💬 Chat History")
         
-        # Display all messages
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                if message["role"] == "user":
-                    st.write(message["content"])
-                else:
-                    # For assistant messages, handle different response formats
-                    if isinstance(message["content"], str):
-                        st.write(message["content"])
-                    elif isinstance(message["content"], dict):
-                        st.json(message["content"])
-                    elif isinstance(message["content"], list):
-                        # Handle list of events
-                        for event in message["content"]:
-                            if isinstance(event, dict) and "content" in event:
-                                if "parts" in event["content"]:
-                                    for part in event["content"]["parts"]:
-                                        if "text" in part:
-                                            st.write(part["text"])
-                                        elif "functionCall" in part:
-                                            st.code(json.dumps(part["functionCall"], indent=2))
-                                        elif "functionResponse" in part:
-                                            st.code(json.dumps(part["functionResponse"], indent=2))
-        
-        # Chat input
-        user_input = st.chat_input("Type your message here...")
+        # Display the most recent messages from their pre-rendered blocks
+        raw_store = get_raw_event_store()
+        render_history(st.session_state.messages, raw_store if show_raw_events else None)
+        
+        # Results of the last finished turn, shown once
+        for kind, notice in st.session_state.turn_notices:
+            if kind == "error":
+                st.error(notice)
+            else:
+                st.info(notice)
+        st.session_state.turn_notices = []
+        
+        # The agent's answer is fetched in the background and polled here
+        if st.session_state.pending_turn is not None:
+            show_pending_turn()
+        
+        # Chat input, one turn at a time per session
+        user_input = st.chat_input(
+            "Type your message here...",
+            disabled=st.session_state.pending_turn is not None
+        )
         
         if user_input:
             # Check if session is created
             if not st.session_state.session_created:
                 st.error("⚠️ Please create a session first before sending messages!")
             else:
-                # Add user message to history
-                st.session_state.messages.append({"role": "user", "content": user_input})
-                
-                # Display user message
-                with st.chat_message("user"):
-                    st.write(user_input)
-                
                 # Prepare the request
                 request_data = {
                     "app_name": agent_name,
@@ -367,91 +856,14 @@ def show_main_app():
                 if use_streaming:
                     request_data["streaming"] = True
                 
-                # Show spinner while waiting for response
-                with st.spinner("🤔 Agent is thinking..."):
-                    try:
-                        if use_streaming:
-                            # Use SSE endpoint for streaming
-                            response = requests.post(
-                                f"{server_url}/run_sse",
-                                headers={"Content-Type": "application/json"},
-                                json=request_data,
-                                stream=True
-                            )
-                            
-                            if response.status_code == 200:
-                                # Process SSE stream
-                                full_response = []
-                                response_placeholder = st.empty()
-                                
-                                for line in response.iter_lines():
-                                    if line:
-                                        line = line.decode('utf-8')
-                                        if line.startswith("data: "):
-                                            try:
-                                                event_data = json.loads(line[6:])
-                                                full_response.append(event_data)
-                                                
-                                                # Extract and display text from the event
-                                                if "content" in event_data and "parts" in event_data["content"]:
-                                                    for part in event_data["content"]["parts"]:
-                                                        if "text" in part:
-                                                            with response_placeholder.container():
-                                                                with st.chat_message("assistant"):
-                                                                    st.write(part["text"])
-                                            except json.JSONDecodeError:
-                                                continue
-                                
-                                # Add to message history
-                                st.session_state.messages.append({
-                                    "role": "assistant",
-                                    "content": full_response
-                                })
-                            else:
-                                st.error(f"❌ Error: {response.text}")
-                        else:
-                            # Use regular endpoint
-                            response = requests.post(
-                                f"{server_url}/run",
-                                headers={"Content-Type": "application/json"},
-                                json=request_data
-                            )
-                            
-                            if response.status_code == 200:
-                                response_data = response.json()
-                                
-                                # Extract and display the response
-                                with st.chat_message("assistant"):
-                                    if isinstance(response_data, list):
-                                        # Process list of events
-                                        response_text = ""
-                                        for event in response_data:
-                                            if isinstance(event, dict) and "content" in event:
-                                                if "parts" in event["content"]:
-                                                    for part in event["content"]["parts"]:
-                                                        if "text" in part:
-                                                            response_text += part["text"]
-                                        
-                                        if response_text:
-                                            st.write(response_text)
-                                        else:
-                                            # Show raw response if no text found
-                                            st.json(response_data)
-                                    else:
-                                        st.json(response_data)
-                                
-                                # Add to message history
-                                st.session_state.messages.append({
-                                    "role": "assistant",
-                                    "content": response_data
-                                })
-                            else:
-                                st.error(f"❌ Error: {response.text}")
-                    
-                    except requests.exceptions.ConnectionError:
-                        st.error("❌ Could not connect to the API server. Please make sure it's running.")
-                    except Exception as e:
-                        st.error(f"❌ An error occurred: {str(e)}")
+                # Hand the call to the shared runner instead of waiting for it here
+                try:
+                    st.session_state.pending_turn = get_turn_runner().submit(server_url, request_data, use_streaming)
+                except queue.Full:
+                    st.error("❌ Too many agent turns are running right now. Please try again in a moment.")
+                else:
+                    st.session_state.messages.append(make_message("user", user_input))
+                    st.rerun()
 
 # Main application logic - Check authentication and render appropriate view
 if not st.session_state.authenticated:
@@ -0,0 +1,441 @@
+"""Load-generation benchmark for the ADK API server.
+
+Starts main.py's FastAPI app in a subprocess with the offline stub model
+from stub_llm.py (ADK_MODEL=stub), then drives concurrent
+create session -> /run -> /run_sse -> delete session cycles against it,
+using the same routes and pooled client as app.py.
+
+    python benchmark.py run --concurrency 16 --cycles 500
+    python benchmark.py compare benchmark-abc1234.json benchmark-def5678.json
+    python benchmark.py startup --top 25
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from adk_client import AdkClient
+from streaming import iter_sse_events
+
+OPERATIONS = ("create_session", "run", "run_sse", "delete_session")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process in MB, read from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_tree(pid: int) -> List[int]:
+    """A process and all its descendants, found through the parent ids in /proc"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces, so fields are counted after its closing ")"
+                ppid = int(stat.read().rpartition(")")[2].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def read_tree_rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process and its descendants in MB, e.g. a uvicorn
+    supervisor and its workers. Shared pages are counted once per process."""
+    rss = [read_rss_mb(member) for member in process_tree(pid)]
+    rss = [value for value in rss if value is not None]
+    return sum(rss) if rss else None
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of a process and its children in the background and keeps start, peak and end"""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[float] = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss = read_tree_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> Dict[str, Optional[float]]:
+        self._stop_event.set()
+        self.join()
+        if not self.samples:
+            return {"start": None, "peak": None, "end": None}
+        return {
+            "start": round(self.samples[0], 1),
+            "peak": round(max(self.samples), 1),
+            "end": round(self.samples[-1], 1),
+        }
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Percentiles of a list of latencies in seconds, reported in ms"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return round(1000 * ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(1000 * statistics.fmean(ordered), 2),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": round(1000 * ordered[-1], 2),
+    }
+
+
+def run_cycle(client: AdkClient, server_url: str, app_name: str, user_id: str, message: str) -> Dict[str, float]:
+    """One session lifecycle; returns the duration of each step in seconds"""
+    session_id = f"bench_{uuid.uuid4().hex[:12]}"
+    timings = {}
+
+    start = time.perf_counter()
+    response = client.create_session(server_url, app_name, user_id, session_id, {"plan": 2})
+    response.raise_for_status()
+    timings["create_session"] = time.perf_counter() - start
+
+    request_data = {
+        "app_name": app_name,
+        "user_id": user_id,
+        "session_id": session_id,
+        "new_message": {"role": "user", "parts": [{"text": message}]},
+    }
+
+    start = time.perf_counter()
+    response = client.run(server_url, request_data)
+    response.raise_for_status()
+    response.json()
+    timings["run"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = client.run_sse(server_url, {**request_data, "streaming": True})
+    response.raise_for_status()
+    for sse_event in iter_sse_events(response.iter_lines()):
+        if "time_to_first_event" not in timings:
+            timings["time_to_first_event"] = time.perf_counter() - start
+        if "error" in json.loads(sse_event.data):
+            raise RuntimeError(sse_event.data)
+    timings["run_sse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = client.delete_session(server_url, app_name, user_id, session_id)
+    response.raise_for_status()
+    timings["delete_session"] = time.perf_counter() - start
+
+    return timings
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"), WEB_CONCURRENCY=str(workers))
+    env.setdefault("ADK_MODEL", "stub")
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--port", str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+
+
+def wait_until_ready(client: AdkClient, server_url: str, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if client.request("GET", f"{server_url}/readyz", "/readyz", timeout=1).status_code == 200:
+                return
+        except Exception:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {server_url} did not become ready within {timeout}s")
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict:
+    server = None
+    server_url = args.server_url
+    if server_url is None:
+        port = free_port()
+        server_url = f"http://127.0.0.1:{port}"
+        server = start_server(port, args.workers)
+
+    client = AdkClient(pool_maxsize=args.concurrency, max_retries=0)
+    try:
+        wait_until_ready(client, server_url)
+        server_pid = server.pid if server else args.server_pid
+
+        # Warm up imports, runners and connections before measuring
+        for index in range(args.warmup):
+            run_cycle(client, server_url, args.app, f"bench_u{index % args.users}", args.message)
+
+        sampler = MemorySampler(server_pid) if server_pid else None
+        if sampler:
+            sampler.start()
+
+        samples: Dict[str, List[float]] = {name: [] for name in OPERATIONS + ("time_to_first_event",)}
+        errors: List[str] = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(run_cycle, client, server_url, args.app, f"bench_u{index % args.users}", args.message)
+                for index in range(args.cycles)
+            ]
+            for future in as_completed(futures):
+                try:
+                    for name, seconds in future.result().items():
+                        samples[name].append(seconds)
+                except Exception as e:
+                    errors.append(str(e))
+        duration = time.perf_counter() - started
+        memory = sampler.stop() if sampler else {"start": None, "peak": None, "end": None}
+    finally:
+        client.close()
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+    completed = args.cycles - len(errors)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "server_url": server_url if args.server_url else "local",
+            "app": args.app,
+            "concurrency": args.concurrency,
+            "workers": args.workers if args.server_url is None else None,
+            "cycles": args.cycles,
+            "users": args.users,
+        },
+        "summary": {
+            "duration_s": round(duration, 3),
+            "cycles_completed": completed,
+            "errors": len(errors),
+            "cycles_per_s": round(completed / duration, 2),
+            "rps": round(completed * len(OPERATIONS) / duration, 2),
+        },
+        "latency_ms": {name: summarize(samples[name]) for name in OPERATIONS},
+        "time_to_first_sse_event_ms": summarize(samples["time_to_first_event"]),
+        "server_memory_mb": memory,
+        "sample_errors": errors[:10],
+    }
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Print the change in throughput and latency between two result files"""
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+
+    def delta(before, after) -> str:
+        if not before or after is None:
+            return "n/a"
+        return f"{100 * (after - before) / before:+.1f}%"
+
+    print(f"{old['meta']['git_commit']} -> {new['meta']['git_commit']}")
+    print(f"rps: {old['summary']['rps']} -> {new['summary']['rps']} ({delta(old['summary']['rps'], new['summary']['rps'])})")
+    sections = [(name, old["latency_ms"].get(name, {}), new["latency_ms"].get(name, {})) for name in OPERATIONS]
+    sections.append(("time_to_first_sse_event", old["time_to_first_sse_event_ms"], new["time_to_first_sse_event_ms"]))
+    for name, before, after in sections:
+        cells = [
+            f"{p} {before.get(p)} -> {after.get(p)} ({delta(before.get(p), after.get(p))})"
+            for p in ("p50", "p95", "p99")
+        ]
+        print(f"{name:>24}: " + " | ".join(cells))
+    peak_before = old["server_memory_mb"]["peak"]
+    peak_after = new["server_memory_mb"]["peak"]
+    print(f"peak server memory MB: {peak_before} -> {peak_after} ({delta(peak_before, peak_after)})")
+
+
+# Run in a fresh interpreter with -X importtime; prints the phase timings as JSON
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+from server_lifecycle import preload_agents
+preload_agents(main.AGENT_DIR)
+preloaded = time.perf_counter()
+print(json.dumps({
+    "import_main": imported - start,
+    "create_app": created - imported,
+    "preload_agents": preloaded - created,
+}))
+"""
+
+
+def parse_importtime(lines: List[str]) -> List[Dict]:
+    """Rows of `python -X importtime` output as module, self and cumulative seconds"""
+    rows = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append({
+            "module": module.strip(),
+            "self": int(self_us) / 1e6,
+            "cumulative": int(cumulative_us) / 1e6,
+        })
+    return rows
+
+
+def profile_startup(top: int) -> Dict:
+    """Time a cold start of main.py's app and break the import cost down by module"""
+    env = dict(os.environ, LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"))
+    env.setdefault("ADK_MODEL", "stub")
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    total = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(result.stderr.splitlines())
+    by_package: Dict[str, float] = {}
+    for row in rows:
+        package = row["module"].split(".")[0]
+        by_package[package] = by_package.get(package, 0.0) + row["self"]
+
+    def ms(seconds: float) -> float:
+        return round(1000 * seconds, 1)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+        },
+        "startup_ms": {"process_total": ms(total), **{name: ms(seconds) for name, seconds in phases.items()}},
+        "modules_imported": len(rows),
+        "top_modules_ms": [
+            {"module": row["module"], "self": ms(row["self"]), "cumulative": ms(row["cumulative"])}
+            for row in sorted(rows, key=lambda row: row["cumulative"], reverse=True)[:top]
+        ],
+        "packages_self_ms": {
+            package: ms(seconds)
+            for package, seconds in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+    }
+
+
+def print_startup(results: Dict) -> None:
+    print(", ".join(f"{name} {value} ms" for name, value in results["startup_ms"].items()))
+    print(f"{results['modules_imported']} modules imported; slowest by cumulative import time (ms):")
+    for row in results["top_modules_ms"]:
+        print(f"{row['cumulative']:>10} {row['self']:>10}  {row['module']}")
+    print("Self import time per top-level package (ms):")
+    for package, value in results["packages_self_ms"].items():
+        print(f"{value:>10}  {package}")
+
+
+def serve(port: int) -> None:
+    """Run main.py's server; the model backend comes from ADK_MODEL, workers from WEB_CONCURRENCY"""
+    import main
+
+    main.serve(host="127.0.0.1", port=port)
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subcommands.add_parser("run", help="Run the benchmark and write JSON results")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--cycles", type=int, default=200)
+    run_parser.add_argument("--warmup", type=int, default=5)
+    run_parser.add_argument("--users", type=int, default=50, help="Distinct user ids to spread sessions over")
+    run_parser.add_argument("--app", default="sample_agent")
+    run_parser.add_argument("--message", default="What time is it?")
+    run_parser.add_argument("--workers", type=int, default=1, help="Worker processes of the local server")
+    run_parser.add_argument("--server-url", help="Benchmark an already running server instead")
+    run_parser.add_argument("--server-pid", type=int, help="PID of that server, to sample its memory")
+    run_parser.add_argument("--output", help="Result file (default: benchmark-<commit>.json)")
+
+    compare_parser = subcommands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+
+    startup_parser = subcommands.add_parser("startup", help="Profile cold start and per-module import time")
+    startup_parser.add_argument("--top", type=int, default=20, help="Modules and packages to list")
+    startup_parser.add_argument("--output", help="Also write the results to this JSON file")
+
+    serve_parser = subcommands.add_parser("serve", help="Run the stub-model server (used by 'run')")
+    serve_parser.add_argument("--port", type=int, default=8080)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.port)
+    elif args.command == "compare":
+        compare(args.old, args.new)
+    elif args.command == "startup":
+        results = profile_startup(args.top)
+        print_startup(results)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2)
+    else:
+        results = run_benchmark(args)
+        output = args.output or f"benchmark-{results['meta']['git_commit']}.json"
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(json.dumps(results["summary"], indent=2))
+        print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
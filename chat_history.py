@@ -0,0 +1,59 @@
+import os
+from typing import List, Optional
+
+import streamlit as st
+
+# The message model has no UI dependencies and lives in chat_messages; re-exported for app.py
+from chat_messages import ChatMessage, RawEventStore, ToolCall, ToolResponse, make_message, normalize
+
+# Number of messages shown initially and added per "load older" click
+CHAT_HISTORY_WINDOW = int(os.environ.get("CHAT_HISTORY_WINDOW", 20))
+
+# Raw ADK events are only kept when enabled, in a compressed, size-capped store
+CHAT_KEEP_RAW_EVENTS = os.environ.get("CHAT_KEEP_RAW_EVENTS", "0") == "1"
+CHAT_RAW_STORE_MB = float(os.environ.get("CHAT_RAW_STORE_MB", 64))
+
+# Streamlit element used to draw each kind of pre-rendered block
+_RENDERERS = {
+    "write": st.write,
+    "code": st.code,
+}
+
+
+def render_message(message: ChatMessage, raw_store: Optional[RawEventStore] = None) -> None:
+    """Draw a chat history entry from its cached blocks"""
+    with st.chat_message(message.role):
+        for kind, value in message.blocks:
+            _RENDERERS[kind](value)
+        if raw_store is not None and message.raw_key:
+            with st.expander("Raw events"):
+                raw_events = raw_store.get(message.raw_key)
+                if raw_events is None:
+                    st.caption("Raw events were evicted from the store.")
+                else:
+                    st.json(raw_events)
+
+
+def history_start(count: int, limit_key: str = "history_limit", noun: str = "messages") -> int:
+    """Index of the first of count entries to draw, with a button to page in older ones"""
+    if limit_key not in st.session_state:
+        st.session_state[limit_key] = CHAT_HISTORY_WINDOW
+
+    hidden = count - st.session_state[limit_key]
+    if hidden > 0:
+        if st.button(f"⬆️ Load older {noun} ({hidden} hidden)", key=f"load_older_{limit_key}"):
+            st.session_state[limit_key] += CHAT_HISTORY_WINDOW
+            st.rerun()
+    return max(hidden, 0)
+
+
+def render_history(messages: List[ChatMessage], raw_store: Optional[RawEventStore] = None) -> None:
+    """Draw the most recent messages, with a button to page in older ones"""
+    for message in messages[history_start(len(messages)):]:
+        render_message(message, raw_store)
+
+
+def reset_history_window() -> None:
+    """Go back to showing only the most recent window of messages and comparisons"""
+    st.session_state.history_limit = CHAT_HISTORY_WINDOW
+    st.session_state.compare_history_limit = CHAT_HISTORY_WINDOW
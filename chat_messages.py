@@ -0,0 +1,130 @@
+import json
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional, Tuple
+
+
+@dataclass(slots=True)
+class ToolCall:
+    """A function call made by the agent, kept in display form"""
+    name: str
+    payload: str
+
+
+@dataclass(slots=True)
+class ToolResponse:
+    """A function response returned to the agent, kept in display form"""
+    name: str
+    payload: str
+
+
+@dataclass(slots=True)
+class ChatMessage:
+    """Normalized chat history entry holding only what the UI displays"""
+    role: str
+    # ("write", text) and ("code", payload) blocks in the order the parts happened
+    blocks: Tuple[Tuple[str, str], ...] = field(default=(), repr=False, compare=False)
+    # Derived from the same parts, for callers that don't render the message
+    text: str = ""
+    tool_calls: Tuple[ToolCall, ...] = ()
+    tool_responses: Tuple[ToolResponse, ...] = ()
+    raw_key: Optional[str] = None
+
+
+class RawEventStore:
+    """Size-capped LRU of zlib-compressed raw event lists, keyed by message"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, events: Any) -> str:
+        key = uuid.uuid4().hex
+        blob = zlib.compress(json.dumps(events, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._entries[key] = blob
+            self._size += len(blob)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return key
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is None:
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(zlib.decompress(blob))
+
+
+def _pretty(value: Any) -> str:
+    return json.dumps(value, indent=2)
+
+
+def normalize(role: str, content: Any) -> ChatMessage:
+    """Reduce a user string or a list of ADK events to a ChatMessage"""
+    if isinstance(content, str):
+        return ChatMessage(role=role, blocks=(("write", content),), text=content)
+
+    blocks, texts, tool_calls, tool_responses = [], [], [], []
+    if isinstance(content, list):
+        for event in content:
+            if not (isinstance(event, dict) and isinstance(event.get("content"), dict)):
+                continue
+            event_text = ""
+            # Adjacent text parts of an event are drawn as one block
+            text_run = ""
+            for part in event["content"].get("parts", []):
+                if "text" in part:
+                    event_text += part["text"]
+                    text_run += part["text"]
+                    continue
+                if text_run:
+                    blocks.append(("write", text_run))
+                    text_run = ""
+                if "functionCall" in part:
+                    call = part["functionCall"]
+                    tool_calls.append(ToolCall(
+                        name=call.get("name", ""),
+                        payload=_pretty({"name": call.get("name"), "args": call.get("args", {})}),
+                    ))
+                    blocks.append(("code", tool_calls[-1].payload))
+                elif "functionResponse" in part:
+                    response = part["functionResponse"]
+                    tool_responses.append(ToolResponse(
+                        name=response.get("name", ""),
+                        payload=_pretty({"name": response.get("name"), "response": response.get("response")}),
+                    ))
+                    blocks.append(("code", tool_responses[-1].payload))
+            if text_run:
+                blocks.append(("write", text_run))
+            if event_text:
+                texts.append(event_text)
+
+    text = "\n\n".join(texts)
+    if not blocks:
+        # Show the raw response if nothing displayable was found
+        text = f"```json\n{_pretty(content)}\n```"
+        blocks.append(("write", text))
+
+    return ChatMessage(
+        role=role,
+        blocks=tuple(blocks),
+        text=text,
+        tool_calls=tuple(tool_calls),
+        tool_responses=tuple(tool_responses),
+    )
+
+
+def make_message(role: str, content: Any, raw_store: Optional[RawEventStore] = None) -> ChatMessage:
+    """Build a chat history entry, optionally keeping the raw events aside"""
+    message = normalize(role, content)
+    if raw_store is not None and not isinstance(content, str):
+        message.raw_key = raw_store.put(content)
+    return message
@@ -0,0 +1,225 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from adk_client import AdkClient
+from streaming import StreamBuffer, iter_sse_events
+
+# Agent calls running at once, shared by every session of the process
+CHAT_TURN_WORKERS = int(os.environ.get("CHAT_TURN_WORKERS", 16))
+# Turns accepted (running plus waiting for a worker) before new ones are refused
+CHAT_TURN_QUEUE = int(os.environ.get("CHAT_TURN_QUEUE", 64))
+# Seconds between UI refreshes while a turn is in flight
+CHAT_POLL_INTERVAL = float(os.environ.get("CHAT_POLL_INTERVAL", 0.5))
+# Reconnects to a dropped /run_sse stream, resuming after the last received event
+SSE_RESUME_ATTEMPTS = int(os.environ.get("SSE_RESUME_ATTEMPTS", 3))
+SSE_RESUME_BACKOFF = float(os.environ.get("SSE_RESUME_BACKOFF", 0.5))
+
+# Errors after which a stream can be resumed rather than failing the turn
+RESUMABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+
+
+class Turn:
+    """One agent call running in the background, polled by the UI.
+
+    The worker appends events and streamed text under a lock; the UI reads
+    snapshots of them on every refresh until the turn is finished.
+    """
+
+    def __init__(self, streaming: bool):
+        self.streaming = streaming
+        self.status = PENDING
+        self.submitted_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._errors: List[str] = []
+        self._events: List[Dict[str, Any]] = []
+        self._buffer = StreamBuffer()
+        self._response: Optional[requests.Response] = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Seconds from submission to the first text of the answer"""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.submitted_at
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds from submission until the turn finished, or until now"""
+        return (self.finished_at or time.monotonic()) - self.submitted_at
+
+    @property
+    def text(self) -> str:
+        with self._lock:
+            return self._buffer.text
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events)
+
+    @property
+    def errors(self) -> List[str]:
+        """Errors reported by the server during the turn, or the one that failed it"""
+        with self._lock:
+            return list(self._errors)
+
+    def cancel(self) -> None:
+        """Stop the turn; an open stream is closed, a blocking /run result is discarded"""
+        self._cancelled.set()
+        with self._lock:
+            response = self._response
+            if not self.finished:
+                self.status = CANCELLED
+                self.finished_at = time.monotonic()
+        if response is not None:
+            response.close()
+
+    def _add_event(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            # Partial events are deltas of a later complete event
+            if not event.get("partial"):
+                self._events.append(event)
+            if self._buffer.feed(event) and self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+
+    def _add_error(self, error: str) -> None:
+        with self._lock:
+            self._errors.append(error)
+
+    def _finish(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._response = None
+            self.finished_at = self.finished_at or time.monotonic()
+            if self.cancelled:
+                self.status = CANCELLED
+            else:
+                self.status = status
+                if error is not None:
+                    self._errors.append(error)
+
+
+class TurnRunner:
+    """Bounded thread pool running agent turns off the Streamlit script thread.
+
+    One instance is shared by every session of a process. Submitting more
+    than max_pending turns at once raises queue.Full.
+    """
+
+    def __init__(self, client: AdkClient, max_workers: int = CHAT_TURN_WORKERS, max_pending: int = CHAT_TURN_QUEUE):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-turn")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(
+        self, server_url: str, request_data: Dict, streaming: bool, initial_state: Optional[Dict] = None
+    ) -> Turn:
+        """Queue a turn; with initial_state, its session is created first if it doesn't exist yet"""
+        if not self._slots.acquire(blocking=False):
+            raise queue.Full
+        turn = Turn(streaming)
+        future = self._executor.submit(self._run, turn, server_url, request_data, initial_state)
+        future.add_done_callback(lambda _: self._slots.release())
+        return turn
+
+    def _run(self, turn: Turn, server_url: str, request_data: Dict, initial_state: Optional[Dict]) -> None:
+        with turn._lock:
+            if turn.cancelled:
+                return
+            turn.status = RUNNING
+        try:
+            if initial_state is not None:
+                self._ensure_session(server_url, request_data, initial_state)
+            if turn.streaming:
+                self._run_sse(turn, server_url, request_data)
+            else:
+                response = self.client.run(server_url, request_data)
+                if response.status_code != 200:
+                    turn._finish(FAILED, response.text)
+                    return
+                response_data = response.json()
+                for event in response_data if isinstance(response_data, list) else [response_data]:
+                    turn._add_event(event)
+            turn._finish(DONE)
+        except requests.exceptions.ConnectionError:
+            turn._finish(FAILED, "Could not connect to the API server. Please make sure it's running.")
+        except Exception as e:
+            turn._finish(FAILED, str(e))
+
+    def _ensure_session(self, server_url: str, request_data: Dict, initial_state: Dict) -> None:
+        session = (request_data["app_name"], request_data["user_id"], request_data["session_id"])
+        response = self.client.get_session(server_url, *session)
+        if response.status_code == 404:
+            response = self.client.create_session(server_url, *session, initial_state)
+        if response.status_code != 200:
+            raise RuntimeError(f"Could not create the session: {response.text}")
+
+    def _run_sse(self, turn: Turn, server_url: str, request_data: Dict) -> None:
+        last_event_id: Optional[str] = None
+        stream_id: Optional[str] = None
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = self.client.run_sse(server_url, request_data, last_event_id=last_event_id)
+                    with turn._lock:
+                        turn._response = response
+                    if turn.cancelled:
+                        response.close()
+                        return
+                    if response.status_code != 200:
+                        raise RuntimeError(response.text)
+                    stream_id = response.headers.get("X-Stream-Id", stream_id)
+
+                    for sse_event in iter_sse_events(response.iter_lines()):
+                        if turn.cancelled:
+                            break
+                        if sse_event.id:
+                            last_event_id = sse_event.id
+                            attempt = 0
+                        try:
+                            event_data = json.loads(sse_event.data)
+                        except json.JSONDecodeError:
+                            continue
+                        if "error" in event_data:
+                            turn._add_error(str(event_data["error"]))
+                            continue
+                        turn._add_event(event_data)
+                    response.close()
+                    return
+                except RESUMABLE_ERRORS:
+                    # Without an event id the server may not have started the run; don't run it twice
+                    if turn.cancelled or last_event_id is None or attempt >= SSE_RESUME_ATTEMPTS:
+                        raise
+                    attempt += 1
+                    time.sleep(SSE_RESUME_BACKOFF * 2 ** (attempt - 1))
+        finally:
+            if turn.cancelled and stream_id:
+                # Closing the connection no longer stops the run on the server
+                try:
+                    self.client.cancel_run_sse(server_url, stream_id)
+                except Exception:
+                    pass
@@ -0,0 +1,285 @@
+"""Batch evaluation of prompts across agents and user profiles.
+
+Runs every prompt of a JSONL file once per user profile and agent, each
+turn in a fresh session whose state is the user's profile (as app.py
+does), and writes one result row per turn with its latency, the tools the
+agent called and the reply text. Turns run concurrently through one pooled
+client; rows are written as they complete.
+
+Each prompt line is either a JSON string or an object with a "prompt"
+field; an optional "id" and any other fields are copied into the rows.
+
+    python evaluate.py prompts.jsonl --concurrency 32
+    python evaluate.py prompts.jsonl --apps sample_agent --users admin,user --output results.parquet
+
+Without --server-url a local server is started as in benchmark.py, using
+the stub model unless ADK_MODEL is set.
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, NamedTuple
+
+from adk_client import AdkClient
+from benchmark import free_port, git_commit, start_server, summarize, wait_until_ready
+from chat_messages import normalize
+from profile_store import create_profile_store
+from streaming import iter_sse_events
+
+
+class EvalCase(NamedTuple):
+    """One turn to run: a prompt sent by one user to one agent"""
+    app_name: str
+    profile: Dict
+    prompt: Dict
+
+
+def read_prompts(path: str) -> List[Dict]:
+    """Load prompt records from a JSONL file, numbering those without an id"""
+    prompts = []
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"prompt": record}
+            if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+                raise ValueError(f"{path}:{line_number}: expected a string or an object with a 'prompt'")
+            record.setdefault("id", str(line_number))
+            prompts.append(record)
+    return prompts
+
+
+def iter_cases(apps: List[str], profiles: List[Dict], prompts: List[Dict]) -> Iterator[EvalCase]:
+    for app_name in apps:
+        for profile in profiles:
+            for prompt in prompts:
+                yield EvalCase(app_name, profile, prompt)
+
+
+def run_case(client: AdkClient, server_url: str, case: EvalCase, stream: bool) -> Dict:
+    """Run one turn in a throwaway session and return its result row"""
+    user_id = case.profile["user_id"]
+    session_id = f"eval_{uuid.uuid4().hex[:12]}"
+    row = {
+        "prompt_id": case.prompt["id"],
+        "app": case.app_name,
+        "user_id": user_id,
+        "plan": case.profile.get("plan"),
+        **{key: value for key, value in case.prompt.items() if key not in ("id", "prompt")},
+        "prompt": case.prompt["prompt"],
+        "ok": False,
+        "error": None,
+        "latency_ms": None,
+        "time_to_first_event_ms": None,
+        "events": 0,
+        "tool_calls": 0,
+        "tools": [],
+        "text": "",
+    }
+
+    created = False
+    try:
+        response = client.create_session(server_url, case.app_name, user_id, session_id, case.profile)
+        if response.status_code != 200:
+            row["error"] = f"create session: {response.status_code} {response.text}"
+            return row
+        created = True
+        request_data = {
+            "app_name": case.app_name,
+            "user_id": user_id,
+            "session_id": session_id,
+            "new_message": {"role": "user", "parts": [{"text": case.prompt["prompt"]}]},
+        }
+        start = time.perf_counter()
+        if stream:
+            events = []
+            response = client.run_sse(server_url, {**request_data, "streaming": True})
+            response.raise_for_status()
+            for sse_event in iter_sse_events(response.iter_lines()):
+                if row["time_to_first_event_ms"] is None:
+                    row["time_to_first_event_ms"] = round(1000 * (time.perf_counter() - start), 2)
+                event = json.loads(sse_event.data)
+                if "error" in event:
+                    raise RuntimeError(event["error"])
+                # Partial events are deltas of a later complete event
+                if not event.get("partial"):
+                    events.append(event)
+        else:
+            response = client.run(server_url, request_data)
+            response.raise_for_status()
+            events = response.json()
+        row["latency_ms"] = round(1000 * (time.perf_counter() - start), 2)
+
+        message = normalize("assistant", events)
+        row.update(
+            ok=True,
+            events=len(events),
+            tool_calls=len(message.tool_calls),
+            tools=[call.name for call in message.tool_calls],
+            text=message.text,
+        )
+    except Exception as e:
+        row["error"] = str(e) if created else f"create session: {e}"
+    finally:
+        if created:
+            try:
+                client.delete_session(server_url, case.app_name, user_id, session_id)
+            except Exception:
+                # A leftover eval session is not worth failing the run for
+                pass
+    return row
+
+
+class JsonlWriter:
+    """Writes one JSON row per line, flushed as each turn completes"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "w")
+
+    def write(self, row: Dict) -> None:
+        self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetWriter:
+    """Buffers rows and writes them to a Parquet file in row groups (needs pyarrow)"""
+
+    def __init__(self, path: str, row_group_size: int = 1000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            sys.exit("Parquet output needs pyarrow: pip install pyarrow")
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self.path = path
+        self.row_group_size = row_group_size
+        self._rows: List[Dict] = []
+        self._writer = None
+
+    def write(self, row: Dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def close(self) -> None:
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        if self._writer is None:
+            table = self._pyarrow.Table.from_pylist(self._rows)
+            self._writer = self._parquet.ParquetWriter(self.path, table.schema)
+        else:
+            table = self._pyarrow.Table.from_pylist(self._rows, schema=self._writer.schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+
+def run_evaluation(args: argparse.Namespace, output: str) -> Dict:
+    prompts = read_prompts(args.prompts)
+    profiles = create_profile_store().users()
+    if args.users:
+        selected = set(args.users.split(","))
+        profiles = [profile for profile in profiles if profile["user_id"] in selected]
+
+    writer = ParquetWriter(output) if output.endswith(".parquet") else JsonlWriter(output)
+
+    server = None
+    server_url = args.server_url
+    if server_url is None:
+        port = free_port()
+        server_url = f"http://127.0.0.1:{port}"
+        server = start_server(port, args.workers)
+
+    client = AdkClient(pool_maxsize=args.concurrency, max_retries=0)
+    latencies: List[float] = []
+    failures = 0
+    completed = 0
+
+    def record(row: Dict) -> None:
+        nonlocal completed, failures
+        writer.write(row)
+        completed += 1
+        if row["ok"]:
+            latencies.append(row["latency_ms"] / 1000)
+        else:
+            failures += 1
+        if completed % 100 == 0 or completed == total:
+            print(f"{completed}/{total} turns, {failures} failed", file=sys.stderr)
+
+    total = 0
+    duration = 0.0
+    try:
+        wait_until_ready(client, server_url)
+        if args.apps:
+            apps = args.apps.split(",")
+        else:
+            response = client.list_apps(server_url)
+            response.raise_for_status()
+            apps = response.json()
+        total = len(apps) * len(profiles) * len(prompts)
+        print(f"Running {total} turns: {len(prompts)} prompts x {len(profiles)} users x {len(apps)} apps")
+
+        started = time.perf_counter()
+        cases = iter_cases(apps, profiles, prompts)
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            # Keep a bounded window of turns in flight instead of queueing every case up front
+            in_flight = set()
+            for case in cases:
+                in_flight.add(pool.submit(run_case, client, server_url, case, args.stream))
+                if len(in_flight) < 2 * args.concurrency:
+                    continue
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(future.result())
+            for future in wait(in_flight).done:
+                record(future.result())
+        duration = time.perf_counter() - started
+    finally:
+        writer.close()
+        client.close()
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+    return {
+        "git_commit": git_commit(),
+        "turns": completed,
+        "failed": failures,
+        "duration_s": round(duration, 3),
+        "turns_per_s": round(completed / duration, 2) if duration else None,
+        "latency_ms": summarize(latencies),
+        "output": output,
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prompts", help="JSONL file of prompts")
+    parser.add_argument("--concurrency", type=int, default=16, help="Turns in flight at once")
+    parser.add_argument("--apps", help="Comma-separated agents (default: all from /list-apps)")
+    parser.add_argument("--users", help="Comma-separated user ids (default: every profile in the profile store)")
+    parser.add_argument("--stream", action="store_true", help="Use /run_sse and record time to the first event")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of the local server")
+    parser.add_argument("--server-url", help="Evaluate against an already running server instead")
+    parser.add_argument("--output", help="Result file, .jsonl or .parquet (default: eval-<commit>.jsonl)")
+
+    args = parser.parse_args()
+    summary = run_evaluation(args, args.output or f"eval-{git_commit()}.jsonl")
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
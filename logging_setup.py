@@ -0,0 +1,87 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Logging defaults, overridable through the environment
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# Per-module levels as "module=LEVEL,..."; ADK logs whole events at INFO on every run
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "google.adk=WARNING")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # "json" or "text"
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Enqueue records with their message merged, leaving formatting to the listener.
+
+    The message arguments are merged in the calling thread, so later changes
+    to them don't show in the log line. Unlike the stock QueueHandler.prepare,
+    tracebacks and the JSON output are formatted on the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def parse_module_levels(spec: str) -> Dict[str, str]:
+    """Parse "module=LEVEL,other=LEVEL" into a dict"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level: str = LOG_LEVEL, module_levels: str = LOG_LEVELS, fmt: str = LOG_FORMAT) -> None:
+    """Send all logging through a queue to a background writer thread.
+
+    Callers only pay for merging the message arguments and enqueueing the
+    record; formatting tracebacks and JSON and writing to stdout happen on
+    the listener thread. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level.upper())
+    for name, module_level in parse_module_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
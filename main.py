@@ -1,39 +1,237 @@
+import asyncio
+import logging
 import os
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI, Request, APIRouter
-from google.adk.cli.fast_api import get_fast_api_app
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, APIRouter
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from logging_setup import configure_logging
+from profile_store import create_profile_store
+from resumable_sse import ResumableStreams, install_resumable_sse
+from server_lifecycle import Lifecycle, preload_agents
+from server_metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, MetricsSync, render_metrics
+from session_admin import (
+    SESSION_PAGE_MAX,
+    BatchCreateRequest,
+    BatchDeleteRequest,
+    decode_cursor,
+    encode_cursor,
+    iter_batch_create,
+    iter_batch_delete,
+    ndjson_progress,
+)
+from webhooks import WebhookPipeline, delivery_id_for
+
+configure_logging()
+logger = logging.getLogger("main")
 
 # Get the directory where main.py is located
 AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
-# Example allowed origins for CORS
-
-# Call the function to get the FastAPI app instance
-print("Initializing FastAPI app...")
-app: FastAPI = get_fast_api_app(
-    agent_dir=AGENT_DIR,
-    allow_origins=["*"],
-    web=False
-)
-print("FastAPI app initialized.")
 
-# You can add more FastAPI routes or configurations below if needed
-@app.get("/hello")
-async def read_root():
-    return {"Hello": "World"}
+# Server defaults, overridable through the environment
+# Use the PORT environment variable provided by Cloud Run, defaulting to 8080
+PORT = int(os.environ.get("PORT", 8080))
+# Worker processes, each with its own event loop, app and agent instances
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+# Seconds in-flight requests (including /run_sse streams) get to finish on shutdown
+SHUTDOWN_TIMEOUT = float(os.environ.get("SHUTDOWN_TIMEOUT", 30))
+
+
+def create_app() -> FastAPI:
+    """Build the API app; called once in every worker process"""
+    # ADK, SQLAlchemy and the session store are imported here rather than at module
+    # level, so the supervisor process and plain `import main` stay cheap. Every
+    # worker still pays for these imports (mostly google.adk) before it is ready.
+    from google.adk.cli.fast_api import get_fast_api_app
+    from google.adk.events import Event, EventActions
+    from google.adk.sessions import Session
+
+    from session_store import create_session_service, use_session_service
+
+    # Sessions are stored according to SESSION_DB_URL (in memory when unset)
+    session_service = create_session_service()
+    use_session_service(session_service)
+
+    # Initial state of sessions created in bulk
+    profile_store = create_profile_store()
+
+    # Webhook deliveries are acknowledged immediately and processed by background workers
+    webhook_pipeline = WebhookPipeline()
+
+    # /run_sse runs are buffered so clients can reconnect without running the agent again
+    sse_streams = ResumableStreams()
+
+    # With several workers, each writes its metrics where /metrics can merge them
+    metrics_sync = MetricsSync()
+
+    lifecycle = Lifecycle()
+    if hasattr(session_service, "ping"):
+        lifecycle.add_check("session_store", session_service.ping)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        webhook_pipeline.start()
+        metrics_sync.start()
+        loaded = preload_agents(AGENT_DIR)
+        logger.info("Worker %d ready, preloaded agents: %s", os.getpid(), ", ".join(loaded) or "none")
+        lifecycle.started = True
+        lifecycle.install_drain_handler()
+        yield
+        lifecycle.draining = True
+        await sse_streams.close()
+        await webhook_pipeline.stop()
+        metrics_sync.stop()
+        # Write out any cached session events and release pooled connections
+        if hasattr(session_service, "close"):
+            session_service.close()
+
+    app: FastAPI = get_fast_api_app(
+        agent_dir=AGENT_DIR,
+        allow_origins=["*"],
+        web=False,
+        lifespan=lifespan
+    )
+    app.add_middleware(MetricsMiddleware)
+    install_resumable_sse(app, sse_streams)
+
+    # You can add more FastAPI routes or configurations below if needed
+    @app.get("/hello")
+    async def read_root():
+        return {"Hello": "World"}
+
+    @app.get("/healthz")
+    async def health():
+        # Liveness: the worker's event loop is responding
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    def readiness():
+        # Readiness: started, not shutting down, and dependencies reachable
+        ready, checks = lifecycle.readiness()
+        return JSONResponse(
+            {"status": "ready" if ready else "unavailable", "checks": checks},
+            status_code=200 if ready else 503,
+        )
+
+    @app.get("/metrics")
+    def metrics():
+        # Every worker's metrics when several are running, see MetricsSync
+        return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    @app.patch("/apps/{app_name}/users/{user_id}/sessions/{session_id}", response_model_exclude_none=True)
+    def update_session_state(app_name: str, user_id: str, session_id: str, state_delta: Dict[str, Any]) -> Session:
+        # Record the changed keys as an event, so only they are written and they show in the history
+        session = session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if state_delta:
+            event = Event(
+                invocation_id=Event.new_id(),
+                author="user",
+                actions=EventActions(state_delta=state_delta),
+            )
+            session_service.append_event(session, event)
+        return session
+
+    @app.get("/apps/{app_name}/sessions")
+    def list_app_sessions(
+        app_name: str,
+        user_id: Optional[List[str]] = Query(None),
+        older_than: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: int = Query(100, ge=1, le=SESSION_PAGE_MAX),
+    ):
+        # One page of every user's sessions; pass next_cursor back for the following page
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        updated_before = time.time() - older_than if older_than is not None else None
+        sessions = session_service.list_session_summaries(
+            app_name, user_ids=user_id, updated_before=updated_before, after=after, limit=limit
+        )
+        return {
+            "sessions": [
+                {"user_id": summary.user_id, "id": summary.session_id, "last_update_time": summary.last_update_time}
+                for summary in sessions
+            ],
+            "next_cursor": encode_cursor(sessions[-1].user_id, sessions[-1].session_id)
+            if len(sessions) == limit else None,
+        }
+
+    @app.post("/apps/{app_name}/sessions/batch_create")
+    def batch_create_sessions(app_name: str, request: BatchCreateRequest) -> StreamingResponse:
+        # Progress is streamed as NDJSON, one line per batch written in a single transaction
+        progress = iter_batch_create(session_service, profile_store, app_name, request)
+        return StreamingResponse(ndjson_progress(progress), media_type="application/x-ndjson")
+
+    @app.post("/apps/{app_name}/sessions/batch_delete")
+    def batch_delete_sessions(app_name: str, request: BatchDeleteRequest) -> StreamingResponse:
+        if request.user_ids is None and request.older_than is None:
+            raise HTTPException(status_code=400, detail="Give user_ids, older_than or both")
+        if request.older_than is not None and request.older_than <= 0:
+            # older_than=0 would match every session of the app
+            raise HTTPException(status_code=400, detail="older_than must be greater than 0")
+        progress = iter_batch_delete(session_service, app_name, request)
+        return StreamingResponse(ndjson_progress(progress), media_type="application/x-ndjson")
+
+    @app.post("/composio/webhook")
+    async def listen_webhooks(request: Request):
+        # Parsing and processing happen in the pipeline workers, not on the request path
+        body = await request.body()
+        try:
+            status = webhook_pipeline.submit(delivery_id_for(request.headers, body), body)
+        except asyncio.QueueFull:
+            return JSONResponse({"status": "busy"}, status_code=503, headers={"Retry-After": "1"})
+        return {"status": status}
+
+    # Debug: Log all routes
+    if logger.isEnabledFor(logging.DEBUG):
+        for route in app.routes:
+            if hasattr(route, 'path'):
+                logger.debug("Route %s: %s", route.path, getattr(route, 'methods', 'N/A'))
+
+    return app
+
+
+def __getattr__(name: str):
+    # `uvicorn main:app` and `from main import app` still work, building the app on first use
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-@app.post("/composio/webhook")
-async def listen_webhooks(request: Request):
-    body = await request.json()
-    print("Request Body:", body)
-    return {"status": "received"}
 
-# Debug: Print all routes
-print("\n=== All Registered Routes ===")
-for route in app.routes:
-    if hasattr(route, 'path'):
-        print(f"{route.path}: {getattr(route, 'methods', 'N/A')}")
+def serve(host: str = "0.0.0.0", port: int = PORT, workers: int = WORKERS) -> None:
+    """Run the app with uvicorn; each worker process calls create_app() once"""
+    metrics_dir = None
+    if workers > 1 and not os.environ.get("METRICS_MULTIPROC_DIR"):
+        # Workers inherit the environment, so they all write their metrics here
+        metrics_dir = tempfile.mkdtemp(prefix="adk-metrics-")
+        os.environ["METRICS_MULTIPROC_DIR"] = metrics_dir
+    try:
+        uvicorn.run(
+            "main:create_app",
+            factory=True,
+            app_dir=AGENT_DIR,
+            host=host,
+            port=port,
+            workers=workers,
+            timeout_graceful_shutdown=SHUTDOWN_TIMEOUT,
+            # log_config=None lets uvicorn's loggers propagate to the queued root handler
+            log_config=None,
+        )
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
 
 if __name__ == "__main__":
-    # Use the PORT environment variable provided by Cloud Run, defaulting to 8080
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
+    serve()
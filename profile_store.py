@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Backend selection, overridable through the environment
+PROFILE_STORE_BACKEND = os.environ.get("PROFILE_STORE_BACKEND", "json")
+PROFILE_STORE_PATH = os.environ.get(
+    "PROFILE_STORE_PATH", os.path.join(os.getcwd(), "mock_database.json")
+)
+
+
+class ProfileStore(ABC):
+    """Read access to user profiles, keyed by user_id"""
+
+    @abstractmethod
+    def get(self, user_id: str) -> Dict:
+        """Return the profile for user_id, or an empty dict if there is none"""
+
+    @abstractmethod
+    def users(self) -> List[Dict]:
+        """Return every profile, ordered by user_id"""
+
+
+class JsonProfileStore(ProfileStore):
+    """Profiles from a JSON file shaped like mock_database.json.
+
+    The file is parsed into a dict index once and only reparsed when its
+    mtime or size changes, so steady-state lookups never touch the JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index: Dict[str, Dict] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Dict:
+        self._maybe_reload()
+        return dict(self._index.get(user_id, {}))
+
+    def users(self) -> List[Dict]:
+        self._maybe_reload()
+        return [dict(self._index[user_id]) for user_id in sorted(self._index)]
+
+    def _maybe_reload(self) -> None:
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+
+        if signature == self._signature:
+            return
+
+        with self._lock:
+            if signature == self._signature:
+                return
+            index = {}
+            if signature is not None:
+                with open(self.path, "r") as file:
+                    data = json.load(file)
+                for user in data.get("users", []):
+                    if "user_id" in user:
+                        index[user["user_id"]] = user
+            self._index = index
+            self._signature = signature
+
+
+class SqliteProfileStore(ProfileStore):
+    """Profiles stored as JSON documents in a SQLite table indexed by user_id"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles (user_id TEXT PRIMARY KEY, profile TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT profile FROM profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def users(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT profile FROM profiles ORDER BY user_id").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def import_users(self, users: Iterable[Dict]) -> int:
+        """Insert or replace profiles, returning how many were written"""
+        rows = [(user["user_id"], json.dumps(user)) for user in users if "user_id" in user]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO profiles (user_id, profile) VALUES (?, ?)", rows
+            )
+            self._conn.commit()
+        return len(rows)
+
+
+def create_profile_store(backend: str = PROFILE_STORE_BACKEND, path: str = PROFILE_STORE_PATH) -> ProfileStore:
+    """Build the configured profile store backend"""
+    if backend == "json":
+        return JsonProfileStore(path)
+    if backend == "sqlite":
+        return SqliteProfileStore(path)
+    raise ValueError(f"Unknown profile store backend: {backend}")
+
+
+if __name__ == "__main__":
+    # Usage: python profile_store.py <users.json> <profiles.db>
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python profile_store.py <users.json> <profiles.db>")
+    with open(sys.argv[1], "r") as file:
+        users = json.load(file).get("users", [])
+    count = SqliteProfileStore(sys.argv[2]).import_users(users)
+    print(f"Imported {count} profiles into {sys.argv[2]}")
@@ -0,0 +1,227 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+
+from server_metrics import counter, gauge
+from streaming import iter_sse_events
+
+logger = logging.getLogger(__name__)
+
+# Resumable stream defaults, overridable through the environment
+# Events kept per agent run for clients that reconnect
+SSE_BUFFER_EVENTS = int(os.environ.get("SSE_BUFFER_EVENTS", 1024))
+# Seconds a finished run's events stay available for resuming
+SSE_RESUME_TTL = float(os.environ.get("SSE_RESUME_TTL", 60))
+# Runs kept per worker; the oldest finished ones are dropped first
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", 1000))
+# Seconds without events before a comment is sent to keep idle connections open
+SSE_KEEPALIVE = float(os.environ.get("SSE_KEEPALIVE", 15))
+
+SSE_STREAMS = gauge("sse_streams", "Agent runs whose events are buffered for resuming")
+SSE_RESUMES = counter("sse_resumes_total", "Reconnects to a buffered agent run by result", ["result"])
+
+
+class StreamGap(Exception):
+    """The events a client asked for have already left the ring buffer"""
+
+
+class EventStream:
+    """Events of one agent run, numbered and kept in a bounded ring buffer.
+
+    The run is pumped into the buffer by a background task, independent of
+    any connection, so clients can follow it, drop off and resume from the
+    last event id they received.
+    """
+
+    def __init__(self, stream_id: str, owner: Tuple[str, str, str], max_events: int = SSE_BUFFER_EVENTS):
+        self.id = stream_id
+        # (app, user, session) of the run; only requests for the same session can resume it
+        self.owner = owner
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._events: Deque[Tuple[int, str]] = deque(maxlen=max_events)
+        self._next_seq = 0
+        self._changed = asyncio.Condition()
+
+    @property
+    def oldest_seq(self) -> int:
+        return self._events[0][0] if self._events else self._next_seq
+
+    async def append(self, payload: str) -> None:
+        async with self._changed:
+            self._events.append((self._next_seq, payload))
+            self._next_seq += 1
+            self._changed.notify_all()
+
+    async def finish(self) -> None:
+        async with self._changed:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    async def follow(self, after: int = -1, keepalive: float = SSE_KEEPALIVE) -> AsyncIterator[str]:
+        """Yield SSE frames for the events after sequence number `after`, until the run ends"""
+        position = after + 1
+        while True:
+            async with self._changed:
+                if position < self.oldest_seq:
+                    raise StreamGap(position)
+                pending = list(itertools.islice(self._events, position - self.oldest_seq, None))
+                finished = self.done
+                if not pending and not finished:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), keepalive)
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+
+            if not pending:
+                if finished:
+                    return
+                yield ": keepalive\n\n"
+                continue
+            for seq, payload in pending:
+                yield f"id: {self.id}:{seq}\ndata: {payload}\n\n"
+            position = pending[-1][0] + 1
+
+
+class ResumableStreams:
+    """The buffered agent runs of one worker, keyed by stream id"""
+
+    def __init__(
+        self,
+        max_events: int = SSE_BUFFER_EVENTS,
+        ttl: float = SSE_RESUME_TTL,
+        max_streams: int = SSE_MAX_STREAMS,
+    ):
+        self.max_events = max_events
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self._streams: "OrderedDict[str, EventStream]" = OrderedDict()
+
+    def start(self, frames: AsyncIterator[str], owner: Tuple[str, str, str]) -> EventStream:
+        """Buffer the SSE frames of an agent run from a background task"""
+        self._prune()
+        stream = EventStream(uuid.uuid4().hex, owner, self.max_events)
+        stream.task = asyncio.create_task(self._pump(stream, frames))
+        self._streams[stream.id] = stream
+        SSE_STREAMS.set(len(self._streams))
+        return stream
+
+    def get(self, stream_id: str) -> Optional[EventStream]:
+        self._prune()
+        return self._streams.get(stream_id)
+
+    def cancel(self, stream_id: str) -> bool:
+        """Stop a running agent run; its buffered events stay available"""
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            return False
+        if stream.task is not None and not stream.done:
+            stream.task.cancel()
+        return True
+
+    async def close(self) -> None:
+        """Cancel the runs still going, e.g. on shutdown"""
+        tasks = [stream.task for stream in self._streams.values() if stream.task is not None and not stream.done]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._streams.clear()
+        SSE_STREAMS.set(0)
+
+    async def _pump(self, stream: EventStream, frames: AsyncIterator[str]) -> None:
+        try:
+            async for frame in frames:
+                for sse_event in iter_sse_events(frame.splitlines()):
+                    await stream.append(sse_event.data)
+        except asyncio.CancelledError:
+            logger.info("Agent run of stream %s cancelled", stream.id)
+        except Exception:
+            logger.exception("Agent run of stream %s failed", stream.id)
+        finally:
+            await stream.finish()
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if stream.done and now - stream.finished_at > self.ttl:
+                del self._streams[stream_id]
+        if len(self._streams) > self.max_streams:
+            for stream_id, stream in list(self._streams.items()):
+                if len(self._streams) <= self.max_streams:
+                    break
+                if stream.done:
+                    del self._streams[stream_id]
+        SSE_STREAMS.set(len(self._streams))
+
+
+def install_resumable_sse(app: FastAPI, streams: ResumableStreams) -> None:
+    """Replace ADK's /run_sse with a version that buffers runs and resumes on Last-Event-ID.
+
+    Event ids have the form "<stream id>:<sequence>". A request carrying a
+    Last-Event-ID header continues that run from the next event instead of
+    starting the agent again, if it is for the same app, user and session.
+    Runs only live in the worker that started them; elsewhere resuming
+    answers 404 rather than starting a new run.
+    """
+    from google.adk.cli.fast_api import AgentRunRequest
+
+    route = next(
+        route for route in app.router.routes
+        if isinstance(route, APIRoute) and route.path == "/run_sse" and "POST" in route.methods
+    )
+    adk_run_sse = route.endpoint
+    app.router.routes.remove(route)
+
+    @app.post("/run_sse")
+    async def agent_run_sse(req: AgentRunRequest, last_event_id: Optional[str] = Header(None)) -> StreamingResponse:
+        owner = (req.app_name, req.user_id, req.session_id)
+        if last_event_id:
+            stream_id, _, seq = last_event_id.rpartition(":")
+            stream = streams.get(stream_id)
+            # Another session's run is reported as missing, so its id can't be probed
+            if stream is None or stream.owner != owner or not seq.isdigit():
+                SSE_RESUMES.inc(result="not_found")
+                raise HTTPException(
+                    status_code=404, detail="Stream not found on this worker; it expired or ran on another worker"
+                )
+            after = int(seq)
+            if after + 1 < stream.oldest_seq:
+                SSE_RESUMES.inc(result="gap")
+                raise HTTPException(status_code=410, detail="Events after Last-Event-ID are no longer buffered")
+            SSE_RESUMES.inc(result="resumed")
+        else:
+            # ADK checks the session and returns its event generator, which is pumped in the background
+            response = await adk_run_sse(req)
+            stream = streams.start(response.body_iterator, owner)
+            after = -1
+
+        async def frames() -> AsyncIterator[str]:
+            try:
+                async for frame in stream.follow(after):
+                    yield frame
+            except StreamGap:
+                yield 'data: {"error": "Client fell behind the stream buffer"}\n\n'
+
+        return StreamingResponse(
+            frames(),
+            media_type="text/event-stream",
+            headers={"X-Stream-Id": stream.id, "Cache-Control": "no-cache"},
+        )
+
+    @app.delete("/run_sse/{stream_id}")
+    async def cancel_run_sse(stream_id: str):
+        if not streams.cancel(stream_id):
+            raise HTTPException(status_code=404, detail="Stream not found")
+        return {"status": "cancelled"}
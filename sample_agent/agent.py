@@ -1,10 +1,34 @@
+import logging
+import os
+
 from google.adk.agents import Agent
 from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
 from google.genai import types
 from typing import Optional
 
-from .general_tools import GeneralToolset
-general_toolset = GeneralToolset()
+from server_metrics import histogram
+from . import general_tools  # Registers the "general" toolset
+from .context_window import ContextWindow
+from .session_state import update_state
+from .tool_registry import TOOL_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Model backend; "stub" or "stub-<profile>" selects the offline model in stub_llm.py
+MODEL = os.environ.get("ADK_MODEL", "gemini-2.0-flash")
+if MODEL.startswith("stub"):
+    import stub_llm  # Registers the stub backend with the LLM registry
+
+CALLBACK_LATENCY = histogram(
+    "adk_callback_duration_seconds", "Time spent in agent callbacks", ["callback"]
+)
+TOOL_RESOLUTION_LATENCY = histogram(
+    "adk_tool_resolution_duration_seconds", "Time spent adding the user's tools to a model call"
+)
+
+# Bounds the history sent with each model call, see CONTEXT_* in context_window.py
+context_window = ContextWindow()
 
 def set_initial_state(callback_context: CallbackContext) -> Optional[types.Content]:
     """
@@ -12,33 +36,56 @@ def set_initial_state(callback_context: CallbackContext) -> Optional[types.Conte
     """
     # Handle the initialized key safely
     if callback_context.state.get("initialized", False):
-        print("State already initialized, skipping.")   
+        logger.debug("State already initialized, skipping.")
     else:
-        print("Setting initial state for the agent.")
-        callback_context.state["initialized"] = True
-        callback_context.state["session_id"] = callback_context._invocation_context.session.id
-        callback_context.state["id"] = callback_context._invocation_context.user_id
+        logger.debug("Setting initial state for the agent.")
+        # Only keys that differ from the session state end up in the persisted delta
+        update_state(callback_context.state, {
+            "initialized": True,
+            "session_id": callback_context._invocation_context.session.id,
+            "id": callback_context._invocation_context.user_id,
+        })
     return None
 
 def before_agent_callback(callback_context: CallbackContext) -> Optional[types.Content]:
     """
-    Callback function to update the toolset based on the current state of the agent.
+    Callback function to prepare the state of the agent for this invocation.
     """
+    with CALLBACK_LATENCY.time(callback="before_agent"):
+        ## Set the initial state if not already set
+        set_initial_state(callback_context)
+        logger.debug("Before agent callback triggered.")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Current state: %s", callback_context.state.to_dict())
 
-    ## Set the initial state if not already set
-    set_initial_state(callback_context)
-    print("Before agent callback triggered.")
-    print(f"Current state: {callback_context.state}")
+    return None
 
-    # Update the toolset based on the current state
-    general_tools = general_toolset.get_tools(callback_context.state)
-    root_agent.tools = general_tools
+def before_model_callback(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """
+    Callback function to give the model request the tools allowed by the user's plan and toolsets,
+    and to window the conversation history it carries.
+    The request is built per model call, so concurrent invocations never share a toolset.
+    """
+    with CALLBACK_LATENCY.time(callback="before_model"):
+        with TOOL_RESOLUTION_LATENCY.time():
+            _add_user_tools(callback_context, llm_request)
+        session = callback_context._invocation_context.session
+        context_window.apply((session.app_name, session.user_id, session.id), llm_request)
 
     return None
 
+def _add_user_tools(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    """Add the user's tools to the model request, as declarations and as callable tools"""
+    tools = TOOL_REGISTRY.get_tools(callback_context.state)
+    if not tools:
+        return
+    if llm_request.config.tools is None:
+        llm_request.config.tools = []
+    llm_request.append_tools(list(tools))
+
 root_agent = Agent(
     name="basic_agent",
-    model="gemini-2.0-flash",
+    model=MODEL,
     description="An agent that has access to different tools such as time and weather lookup",
     instruction="""
 You are an AI agent that can perform various tasks using tools. Some of these tools are dependent on the user's plan.
@@ -52,5 +99,8 @@ The Pro Plan has access to all tools, including:
 Always start by listing all the tools available to the user based on their current plan. Use the retrieve_user_plan tool to get the user's current plan and display it to them.
 If the request needs a tool that is not available in the current plan, you should inform the user and suggest upgrading their plan.
     """,
+    # Tools are added per model call by before_model_callback, from TOOL_REGISTRY
+    tools=[],
     before_agent_callback=before_agent_callback,
+    before_model_callback=before_model_callback,
 )
\ No newline at end of file
@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, NamedTuple, Tuple
+
+from google.adk.models import LlmRequest
+from google.genai import types
+
+from server_metrics import histogram
+
+# Context window defaults, overridable through the environment
+# Most recent contents sent verbatim; older ones are folded into a summary (0 sends everything)
+CONTEXT_KEEP_EVENTS = int(os.environ.get("CONTEXT_KEEP_EVENTS", 20))
+# Upper bound on the summary of older turns; the oldest lines are dropped first
+CONTEXT_SUMMARY_MAX_CHARS = int(os.environ.get("CONTEXT_SUMMARY_MAX_CHARS", 4000))
+# Tool responses from earlier turns larger than this are cut to a preview (0 keeps them whole)
+CONTEXT_TOOL_RESPONSE_MAX_CHARS = int(os.environ.get("CONTEXT_TOOL_RESPONSE_MAX_CHARS", 2000))
+# Sessions whose rolling summary is kept in memory, per worker
+CONTEXT_SUMMARY_CACHE_SIZE = int(os.environ.get("CONTEXT_SUMMARY_CACHE_SIZE", 1024))
+
+# Longest text kept from a single content in the summary
+SUMMARY_LINE_CHARS = 200
+
+CONTEXT_CONTENTS = histogram(
+    "adk_context_contents",
+    "Contents sent to the model per call, after windowing",
+    buckets=(5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+
+class _Summary(NamedTuple):
+    """Summary lines of the first `folded` contents of a session"""
+    folded: int
+    lines: Tuple[str, ...]
+    truncated: bool
+    # Identifies the folded contents, see _fingerprint
+    fingerprint: Tuple[int, ...]
+
+
+def _shorten(text: str, limit: int = SUMMARY_LINE_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _dump(value) -> str:
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+def summarize_content(content: types.Content) -> List[str]:
+    """One line per part of a content, in the order they happened"""
+    speaker = "User" if content.role == "user" else "Agent"
+    lines = []
+    for part in content.parts or []:
+        if part.text:
+            lines.append(f"{speaker}: {_shorten(part.text)}")
+        elif part.function_call:
+            call = part.function_call
+            lines.append(f"Agent called {call.name}({_shorten(_dump(call.args or {}))})")
+        elif part.function_response:
+            response = part.function_response
+            lines.append(f"{response.name} returned {_shorten(_dump(response.response))}")
+    return lines
+
+
+def _fingerprint(contents: List[types.Content], folded: int) -> Tuple[int, ...]:
+    """Hashes of the first and last folded contents.
+
+    A session deleted and recreated with the same id has the same key but a
+    different history, so its cached summary must not be reused.
+    """
+    if folded <= 0 or folded > len(contents):
+        return ()
+    return tuple(hash(contents[index].model_dump_json()) for index in sorted({0, folded - 1}))
+
+
+def _is_user_message(content: types.Content) -> bool:
+    """A user turn with text, as opposed to a function response sent back to the model"""
+    return content.role == "user" and any(part.text for part in content.parts or [])
+
+
+class ContextWindow:
+    """Bounds the history sent to the model on each call.
+
+    The last `keep` contents are sent verbatim, starting at a user message so
+    function calls stay paired with their responses. Older contents are folded
+    into a plain-text summary added to the system instruction. Sessions only
+    grow, so the summary is cached per session and extended with just the
+    contents that fell out of the window since the previous call. The summary
+    is rebuilt when the folded contents no longer match, as when a session is
+    recreated with the same id. Large tool responses from earlier turns are cut
+    to a preview.
+    """
+
+    def __init__(
+        self,
+        keep: int = CONTEXT_KEEP_EVENTS,
+        summary_max_chars: int = CONTEXT_SUMMARY_MAX_CHARS,
+        tool_response_max_chars: int = CONTEXT_TOOL_RESPONSE_MAX_CHARS,
+        cache_size: int = CONTEXT_SUMMARY_CACHE_SIZE,
+    ):
+        self.keep = keep
+        self.summary_max_chars = summary_max_chars
+        self.tool_response_max_chars = tool_response_max_chars
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[Hashable, _Summary]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def apply(self, session_key: Hashable, llm_request: LlmRequest) -> None:
+        """Window, summarize and trim the request's contents in place"""
+        contents = llm_request.contents
+        cut = self._cut_index(contents)
+        if cut > 0:
+            summary = self._summary(session_key, contents, cut)
+            llm_request.contents = contents = contents[cut:]
+            llm_request.append_instructions([summary])
+        self._trim_tool_responses(contents)
+        CONTEXT_CONTENTS.observe(len(contents))
+
+    def _cut_index(self, contents: List[types.Content]) -> int:
+        if self.keep <= 0 or len(contents) <= self.keep:
+            return 0
+        user_messages = [index for index, content in enumerate(contents) if _is_user_message(content)]
+        start = len(contents) - self.keep
+        # The first user message inside the window, or the start of the current turn if it is longer
+        return next((index for index in user_messages if index >= start), user_messages[-1] if user_messages else 0)
+
+    def _summary(self, session_key: Hashable, contents: List[types.Content], cut: int) -> str:
+        with self._lock:
+            cached = self._summaries.get(session_key)
+        if cached is None or cached.folded > cut or cached.fingerprint != _fingerprint(contents, cached.folded):
+            cached = _Summary(0, (), False, ())
+
+        lines = list(cached.lines)
+        for content in contents[cached.folded:cut]:
+            lines.extend(summarize_content(content))
+        fitted = self._fit(lines)
+        truncated = cached.truncated or len(fitted) < len(lines)
+
+        with self._lock:
+            self._summaries[session_key] = _Summary(cut, tuple(fitted), truncated, _fingerprint(contents, cut))
+            self._summaries.move_to_end(session_key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+        omitted = "(earlier turns omitted)\n" if truncated else ""
+        return "Summary of the earlier conversation with the user:\n" + omitted + "\n".join(fitted)
+
+    def _fit(self, lines: List[str]) -> List[str]:
+        """Drop the oldest lines until the summary fits its size bound"""
+        total = sum(len(line) + 1 for line in lines)
+        start = 0
+        while total > self.summary_max_chars and start < len(lines):
+            total -= len(lines[start]) + 1
+            start += 1
+        return lines[start:]
+
+    def _trim_tool_responses(self, contents: List[types.Content]) -> None:
+        if self.tool_response_max_chars <= 0:
+            return
+        # Responses of the current turn, after the last user message, are left whole
+        last_user = max((index for index, content in enumerate(contents) if _is_user_message(content)), default=0)
+        for content in contents[:last_user]:
+            for part in content.parts or []:
+                response = part.function_response
+                if response is None or response.response is None:
+                    continue
+                payload = _dump(response.response)
+                if len(payload) > self.tool_response_max_chars:
+                    response.response = {
+                        "truncated": True,
+                        "preview": payload[:self.tool_response_max_chars],
+                    }
@@ -0,0 +1,16 @@
+from typing import Any, Dict, Mapping
+
+from google.adk.sessions.state import State
+
+
+def update_state(state: State, values: Mapping[str, Any]) -> Dict[str, Any]:
+    """Write only the keys whose value changed, returning them.
+
+    Every assignment to a callback or tool context's state is recorded in
+    the event's state delta and persisted, even when the value is the same,
+    so unchanged keys are skipped here.
+    """
+    changed = {key: value for key, value in values.items() if key not in state or state[key] != value}
+    if changed:
+        state.update(changed)
+    return changed
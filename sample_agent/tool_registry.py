@@ -0,0 +1,258 @@
+import copy
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from enum import IntEnum
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from google.adk.tools import BaseTool, FunctionTool
+
+from server_metrics import counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+TOOL_LATENCY = histogram(
+    "adk_tool_duration_seconds", "Tool execution time", ["tool", "status"]
+)
+
+TOOL_CACHE_REQUESTS = counter(
+    "adk_tool_cache_requests_total", "Tool result cache lookups by result", ["tool", "result"]
+)
+TOOL_CACHE_ENTRIES = gauge(
+    "adk_tool_cache_entries", "Tool results currently cached", ["tool"]
+)
+
+# Toolsets a user gets when their profile does not list any
+DEFAULT_TOOLSETS: FrozenSet[str] = frozenset({"general"})
+# Set to 0 to run every tool call, ignoring @cached_tool
+TOOL_CACHE_ENABLED = os.environ.get("TOOL_CACHE_ENABLED", "1") == "1"
+
+
+class ToolTier(IntEnum):
+    """Tool access tiers based on user plan"""
+    BASIC = 1
+    PRO = 2
+    TEAM = 3
+
+
+def timed_tool(func: Callable) -> Callable:
+    """Wrap a tool function to record its execution time"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = func(*args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            TOOL_LATENCY.observe(time.perf_counter() - start, tool=func.__name__, status=status)
+    return wrapper
+
+
+class ToolCache:
+    """TTL and size-bounded LRU of one tool's results.
+
+    Keys are the call's arguments plus the listed session state fields, so
+    users on different plans never share an entry. Results are copied in
+    and out, as ADK may modify the returned value.
+    """
+
+    def __init__(self, tool_name: str, ttl: float, maxsize: int, state_keys: Sequence[str]):
+        self.tool_name = tool_name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.state_keys = tuple(state_keys)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, arguments: Mapping[str, Any], state: Optional[Mapping]) -> str:
+        state_values = {name: state.get(name) if state is not None else None for name in self.state_keys}
+        return json.dumps([arguments, state_values], sort_keys=True, default=repr)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (found, result) for a key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                TOOL_CACHE_ENTRIES.set(len(self._entries), tool=self.tool_name)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                TOOL_CACHE_REQUESTS.inc(tool=self.tool_name, result="miss")
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        TOOL_CACHE_REQUESTS.inc(tool=self.tool_name, result="hit")
+        return True, copy.deepcopy(entry[1])
+
+    def put(self, key: str, result: Any) -> None:
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            TOOL_CACHE_ENTRIES.set(len(self._entries), tool=self.tool_name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            TOOL_CACHE_ENTRIES.set(0, tool=self.tool_name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tool": self.tool_name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+def cached_tool(ttl: float, maxsize: int = 256, state_keys: Sequence[str] = ("plan",)) -> Callable[[Callable], Callable]:
+    """Decorator memoizing a tool's results for `ttl` seconds.
+
+    Only for tools whose result depends on nothing but their arguments and
+    the given session state fields, and that change no state. Apply it below
+    @requires_tier; the cache is kept on the function as `_cache`.
+    """
+    def decorator(func: Callable) -> Callable:
+        cache = ToolCache(func.__name__, ttl, maxsize, state_keys)
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TOOL_CACHE_ENABLED:
+                return func(*args, **kwargs)
+            arguments = signature.bind(*args, **kwargs).arguments
+            tool_context = arguments.pop("tool_context", None)
+            key = cache.key(arguments, tool_context.state if tool_context is not None else None)
+            found, result = cache.get(key)
+            if not found:
+                result = func(*args, **kwargs)
+                cache.put(key, result)
+            return result
+
+        wrapper._cache = cache
+        return wrapper
+    return decorator
+
+
+class ToolSpec(NamedTuple):
+    """A registered tool function and the access it requires"""
+    func: Callable
+    toolset: str
+    minimum_tier: ToolTier
+
+
+class ToolRegistry:
+    """Tool functions grouped into named toolsets, each with a minimum tier.
+
+    Functions are registered at import time by the requires_tier decorator,
+    but FunctionTool objects are only built the first time a tier and set of
+    toolsets asks for them. The resulting tuples are cached, so resolving a
+    user's tools is one dict lookup per model call.
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, ToolSpec] = {}
+        self._tools: Dict[str, BaseTool] = {}
+        self._by_access: Dict[Tuple[ToolTier, FrozenSet[str]], Tuple[BaseTool, ...]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, func: Callable, minimum_tier: ToolTier, toolset: str = "general") -> Callable:
+        """Add a tool function; registering a name again replaces it"""
+        with self._lock:
+            self._specs[func.__name__] = ToolSpec(func, toolset, minimum_tier)
+            self._tools.pop(func.__name__, None)
+            self._by_access = {}
+        logger.debug("Registered tool %s in toolset %s", func.__name__, toolset)
+        return func
+
+    def requires_tier(self, minimum_tier: ToolTier, toolset: str = "general") -> Callable[[Callable], Callable]:
+        """Decorator registering a function as a tool of a toolset for a minimum tier"""
+        def decorator(func: Callable) -> Callable:
+            func._minimum_tier = minimum_tier
+            return self.register(func, minimum_tier, toolset)
+        return decorator
+
+    def toolsets(self) -> FrozenSet[str]:
+        with self._lock:
+            return frozenset(spec.toolset for spec in self._specs.values())
+
+    def get_tools(self, state: Optional[Mapping] = None) -> Tuple[BaseTool, ...]:
+        """Return the tools the user's plan and toolsets allow"""
+        key = (user_tier(state), user_toolsets(state))
+        tools = self._by_access.get(key)
+        if tools is None:
+            tools = self._build(*key)
+        return tools
+
+    def cache_stats(self) -> List[Dict[str, Any]]:
+        """Hit and miss counts of every tool that caches its results"""
+        with self._lock:
+            caches = [getattr(spec.func, "_cache", None) for spec in self._specs.values()]
+        return [cache.stats() for cache in caches if cache is not None]
+
+    def get_all_tools(self) -> List[BaseTool]:
+        """Return every registered tool (bypasses tier and toolset filtering)"""
+        with self._lock:
+            return [self._tool(name) for name in self._specs]
+
+    def _build(self, tier: ToolTier, toolsets: FrozenSet[str]) -> Tuple[BaseTool, ...]:
+        with self._lock:
+            tools = self._by_access.get((tier, toolsets))
+            if tools is None:
+                tools = tuple(
+                    self._tool(name) for name, spec in self._specs.items()
+                    if spec.toolset in toolsets and tier >= spec.minimum_tier
+                )
+                self._by_access[(tier, toolsets)] = tools
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "Tools for tier %s, toolsets %s: %s",
+                        tier.name, sorted(toolsets), [tool.name for tool in tools],
+                    )
+        return tools
+
+    def _tool(self, name: str) -> BaseTool:
+        # Called with the lock held
+        tool = self._tools.get(name)
+        if tool is None:
+            func = self._specs[name].func
+            tool = self._tools[name] = FunctionTool(func=timed_tool(func))
+        return tool
+
+
+# Registry filled by the @requires_tier decorators of the tool modules
+TOOL_REGISTRY = ToolRegistry()
+requires_tier = TOOL_REGISTRY.requires_tier
+
+
+def user_tier(state: Optional[Mapping]) -> ToolTier:
+    """Determine user tier based on state"""
+    if not state:
+        return ToolTier.BASIC
+    try:
+        return ToolTier(state.get('plan', 1))
+    except ValueError:
+        return ToolTier.BASIC
+
+
+def user_toolsets(state: Optional[Mapping]) -> FrozenSet[str]:
+    """Toolsets listed in the user's profile, or the default ones"""
+    toolsets: Optional[Iterable[str]] = state.get('toolsets') if state else None
+    if not toolsets or isinstance(toolsets, str):
+        return DEFAULT_TOOLSETS
+    return frozenset(toolsets)
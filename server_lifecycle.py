@@ -0,0 +1,97 @@
+import asyncio
+import importlib
+import logging
+import os
+import signal
+import threading
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds to keep serving, but report not ready, after SIGTERM before shutting down,
+# so load balancers stop routing to this worker before it stops accepting connections
+SHUTDOWN_DELAY = float(os.environ.get("SHUTDOWN_DELAY", 0))
+# Agents imported at worker startup: comma-separated names, "*" for all, empty for none
+PRELOAD_AGENTS = os.environ.get("PRELOAD_AGENTS", "*")
+
+
+def list_agent_names(agent_dir: str) -> List[str]:
+    """Agent packages in a directory, matching ADK's /list-apps"""
+    return sorted(
+        name for name in os.listdir(agent_dir)
+        if os.path.isdir(os.path.join(agent_dir, name)) and not name.startswith(".") and name != "__pycache__"
+    )
+
+
+def preload_agents(agent_dir: str, names: str = PRELOAD_AGENTS) -> List[str]:
+    """Import agent modules ahead of the first request, returning those loaded.
+
+    ADK imports an agent the first time it is run, which otherwise lands on
+    the first user's request in every worker.
+    """
+    selected = list_agent_names(agent_dir) if names.strip() == "*" else [
+        name.strip() for name in names.split(",") if name.strip()
+    ]
+    loaded = []
+    for name in selected:
+        try:
+            module = importlib.import_module(name)
+            getattr(module, "agent").root_agent
+            loaded.append(name)
+        except Exception:
+            logger.exception("Failed to preload agent %s", name)
+    return loaded
+
+
+class Lifecycle:
+    """Liveness and readiness state of one worker.
+
+    Ready once startup has finished, until shutdown begins, and only while
+    every registered dependency check passes.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.draining = False
+        self._checks: Dict[str, Callable[[], bool]] = {}
+        self._lock = threading.Lock()
+
+    def add_check(self, name: str, check: Callable[[], bool]) -> None:
+        with self._lock:
+            self._checks[name] = check
+
+    def readiness(self) -> Tuple[bool, Dict[str, bool]]:
+        """Overall readiness and the result of each check"""
+        with self._lock:
+            checks = list(self._checks.items())
+        results = {"started": self.started, "accepting": not self.draining}
+        for name, check in checks:
+            try:
+                results[name] = bool(check())
+            except Exception:
+                logger.warning("Readiness check %s failed", name, exc_info=True)
+                results[name] = False
+        return all(results.values()), results
+
+    def install_drain_handler(self, delay: float = SHUTDOWN_DELAY) -> None:
+        """Mark the worker as draining on SIGTERM, then hand the signal to the server.
+
+        Must be called from the main thread once the server has installed its
+        own handlers, i.e. during lifespan startup.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        server_handler = signal.getsignal(signal.SIGTERM)
+        if not callable(server_handler):
+            return
+        loop = asyncio.get_running_loop()
+
+        def handle_sigterm(signum, frame):
+            if self.draining:
+                server_handler(signum, frame)
+                return
+            self.draining = True
+            logger.info("Received SIGTERM, draining for %.1fs before shutdown", delay)
+            loop.call_soon_threadsafe(loop.call_later, delay, server_handler, signum, frame)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
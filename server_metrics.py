@@ -0,0 +1,382 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Directory shared by the worker processes of one server, where each writes its
+# metrics so /metrics reports all of them; main.serve() sets it for several workers
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR", "")
+# Seconds between writes of a worker's metrics to METRICS_MULTIPROC_DIR
+METRICS_SYNC_INTERVAL = float(os.environ.get("METRICS_SYNC_INTERVAL", 5))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    """Base class for a labelled metric family"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Value per label set; Histogram keeps its own series instead
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def series(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        """Every label set and its value, for merging the metrics of several workers"""
+        with self._lock:
+            return list(self._values.items())
+
+    def add_series(self, key: Tuple[str, ...], value: Any) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+
+class Counter(Metric):
+    """Monotonically increasing value per label set"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}")
+        return lines
+
+
+class Gauge(Metric):
+    """Value per label set that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    """Cumulative latency histogram per label set"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def series(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return [(key, [list(counts), total[0]]) for key, (counts, total) in self._series.items()]
+
+    def add_series(self, key: Tuple[str, ...], value: Any) -> None:
+        counts, total = value
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            for index, count in enumerate(counts[:len(series[0])]):
+                series[0][index] += count
+            series[1][0] += total
+
+    def time(self, **labels: str) -> "_Timer":
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_number(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                cumulative += counts[-1]
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_number(total[0])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """Collection of metrics rendered together in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Write every metric's series to a JSON file, replacing it atomically"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        data = {
+            metric.name: {
+                "kind": metric.kind,
+                "documentation": metric.documentation,
+                "labelnames": metric.labelnames,
+                "buckets": getattr(metric, "buckets", None),
+                "series": [[list(key), value] for key, value in metric.series()],
+            }
+            for metric in metrics
+        }
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(data, file)
+        os.replace(temporary, path)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge_dumps(directory: str) -> Registry:
+    """The metrics of every worker that wrote to `directory`, added together.
+
+    Counters and histograms of workers that have exited still count, so
+    totals don't drop when a worker is replaced; their gauges are left out.
+    """
+    metric_types = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+    merged = Registry()
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            pid = int(os.path.basename(path)[:-len(".json")])
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            logger.warning("Skipping unreadable metrics file %s", path)
+            continue
+        alive = _process_alive(pid)
+        for name, entry in data.items():
+            if entry["kind"] == "gauge" and not alive:
+                continue
+            metric = merged._metrics.get(name)
+            if metric is None:
+                arguments = (name, entry["documentation"], entry["labelnames"])
+                if entry["kind"] == "histogram":
+                    arguments += (entry["buckets"],)
+                metric = merged.register(metric_types[entry["kind"]](*arguments))
+            for key, value in entry["series"]:
+                metric.add_series(tuple(key), value)
+    return merged
+
+
+REGISTRY = Registry()
+
+
+def _dump_path() -> str:
+    return os.path.join(METRICS_MULTIPROC_DIR, f"{os.getpid()}.json")
+
+
+def render_metrics() -> str:
+    """The /metrics payload: this process's metrics, or every worker's with METRICS_MULTIPROC_DIR"""
+    if not METRICS_MULTIPROC_DIR:
+        return REGISTRY.render()
+    REGISTRY.dump(_dump_path())
+    return merge_dumps(METRICS_MULTIPROC_DIR).render()
+
+
+class MetricsSync:
+    """Writes this worker's metrics to METRICS_MULTIPROC_DIR every few seconds.
+
+    A scrape reaches one worker, which reports its own metrics as of now and
+    the other workers' as of their last write, at most `interval` old.
+    """
+
+    def __init__(self, interval: float = METRICS_SYNC_INTERVAL):
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if not METRICS_MULTIPROC_DIR:
+            return
+        self._thread = threading.Thread(target=self._run, name="metrics-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write the final values, so counters of this worker outlive it"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        REGISTRY.dump(_dump_path())
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                REGISTRY.dump(_dump_path())
+            except OSError:
+                logger.exception("Failed to write metrics to %s", METRICS_MULTIPROC_DIR)
+            self._stop_event.wait(self.interval)
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(
+    name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+HTTP_REQUESTS = counter(
+    "http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+)
+HTTP_LATENCY = histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route, until the response body is complete",
+    ["method", "route"],
+)
+
+HTTP_IN_FLIGHT = gauge(
+    "http_requests_in_flight", "Requests being handled, including open streams"
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request counts and latency.
+
+    Routes are labelled by their path template, so ids in the URL do not
+    create new series. Streaming responses are timed until the last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        HTTP_IN_FLIGHT.inc()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(status))
+            HTTP_LATENCY.observe(time.perf_counter() - start, method=method, route=route)
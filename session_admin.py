@@ -0,0 +1,127 @@
+import base64
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from profile_store import ProfileStore
+from server_metrics import counter
+
+logger = logging.getLogger(__name__)
+
+# Bulk session defaults, overridable through the environment
+# Sessions created or deleted per database transaction, and per progress line
+SESSION_BATCH_SIZE = int(os.environ.get("SESSION_BATCH_SIZE", 500))
+# Largest page the session listing returns
+SESSION_PAGE_MAX = int(os.environ.get("SESSION_PAGE_MAX", 1000))
+
+SESSION_BULK_SESSIONS = counter(
+    "session_bulk_sessions_total", "Sessions created or deleted by the bulk session routes", ["operation"]
+)
+
+
+class BatchCreateRequest(BaseModel):
+    """Sessions to create, one per user"""
+    # Users to create a session for; every profile in the profile store when unset
+    user_ids: Optional[List[str]] = None
+    # The same session id for every user, or a new random one each when unset
+    session_id: Optional[str] = None
+    # State added on top of each user's profile
+    state: Dict[str, Any] = {}
+
+
+class BatchDeleteRequest(BaseModel):
+    """Which sessions to delete; at least one filter is required"""
+    user_ids: Optional[List[str]] = None
+    # Only sessions not updated for this many seconds; must be greater than 0
+    older_than: Optional[float] = None
+
+
+def encode_cursor(user_id: str, session_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([user_id, session_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """The (user_id, session_id) key a page continues after; ValueError when malformed"""
+    try:
+        user_id, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Malformed cursor")
+    return str(user_id), str(session_id)
+
+
+def iter_batch_create(
+    session_service, profiles: ProfileStore, app_name: str, request: BatchCreateRequest,
+    batch_size: int = SESSION_BATCH_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """Create a session per user in batches, yielding progress after each batch.
+
+    Each session starts with the user's profile as its state, as the UI does
+    for a single session. Sessions that already exist are left unchanged.
+    """
+    if request.user_ids is None:
+        users = profiles.users()
+    else:
+        users = [profiles.get(user_id) or {"user_id": user_id} for user_id in dict.fromkeys(request.user_ids)]
+
+    progress = {"total": len(users), "done": 0, "created": 0, "skipped": 0}
+    start = time.perf_counter()
+    yield dict(progress)
+    for offset in range(0, len(users), batch_size):
+        batch = [
+            (profile["user_id"], request.session_id or f"s_{uuid.uuid4().hex}", {**profile, **request.state})
+            for profile in users[offset:offset + batch_size]
+        ]
+        created = session_service.create_sessions(app_name, batch)
+        SESSION_BULK_SESSIONS.inc(created, operation="create")
+        progress["done"] += len(batch)
+        progress["created"] += created
+        progress["skipped"] += len(batch) - created
+        yield dict(progress)
+    logger.info("Created %d sessions of %s in %.2fs", progress["created"], app_name, time.perf_counter() - start)
+
+
+def iter_batch_delete(
+    session_service, app_name: str, request: BatchDeleteRequest, batch_size: int = SESSION_BATCH_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """Delete the matching sessions in batches, yielding progress after each batch"""
+    filters = {
+        "user_ids": request.user_ids,
+        "updated_before": time.time() - request.older_than if request.older_than is not None else None,
+    }
+    progress = {"total": session_service.count_sessions(app_name, **filters), "done": 0, "deleted": 0}
+    start = time.perf_counter()
+    yield dict(progress)
+    after = None
+    while True:
+        batch = session_service.list_session_summaries(app_name, after=after, limit=batch_size, **filters)
+        if not batch:
+            break
+        deleted = session_service.delete_sessions(
+            app_name, [(summary.user_id, summary.session_id) for summary in batch], filters["updated_before"]
+        )
+        SESSION_BULK_SESSIONS.inc(deleted, operation="delete")
+        after = (batch[-1].user_id, batch[-1].session_id)
+        progress["done"] += len(batch)
+        progress["deleted"] += deleted
+        yield dict(progress)
+    logger.info("Deleted %d sessions of %s in %.2fs", progress["deleted"], app_name, time.perf_counter() - start)
+
+
+def ndjson_progress(progress: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """One JSON line per progress update, ending with a line whose status is
+    "complete" or "error". The response has started by the time a batch
+    fails, so errors are reported in the stream rather than as a status code."""
+    last: Dict[str, Any] = {}
+    try:
+        for last in progress:
+            yield json.dumps(last) + "\n"
+    except Exception as e:
+        logger.exception("Bulk session operation failed")
+        yield json.dumps({**last, "status": "error", "error": str(e)}) + "\n"
+        return
+    yield json.dumps({**last, "status": "complete"}) + "\n"
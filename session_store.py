@@ -0,0 +1,700 @@
+import base64
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from google.adk.cli import fast_api
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListEventsResponse, ListSessionsResponse
+from google.adk.sessions.database_session_service import (
+    Base,
+    DatabaseSessionService,
+    DynamicJSON,
+    StorageAppState,
+    StorageEvent,
+    StorageSession,
+    StorageUserState,
+    _extract_state_delta,
+)
+from sqlalchemy import and_, cast, create_engine, delete, event, func, insert, literal, or_, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.inspection import inspect
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import MetaData
+
+from server_metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+# Session storage defaults, overridable through the environment.
+# An empty SESSION_DB_URL keeps sessions in process memory.
+SESSION_DB_URL = os.environ.get("SESSION_DB_URL", "")
+SESSION_DB_POOL_SIZE = int(os.environ.get("SESSION_DB_POOL_SIZE", 5))
+SESSION_DB_MAX_OVERFLOW = int(os.environ.get("SESSION_DB_MAX_OVERFLOW", 10))
+SESSION_DB_POOL_TIMEOUT = float(os.environ.get("SESSION_DB_POOL_TIMEOUT", 30))
+SESSION_DB_POOL_RECYCLE = int(os.environ.get("SESSION_DB_POOL_RECYCLE", 1800))
+SESSION_SQLITE_WAL = os.environ.get("SESSION_SQLITE_WAL", "1") == "1"
+# Write-behind cache of hot sessions; 0 disables it
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", 0))
+SESSION_CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL", 30))
+
+SESSION_CACHE_REQUESTS = counter(
+    "session_cache_requests_total", "Session cache lookups by result", ["result"]
+)
+SESSION_WRITES_PENDING = gauge(
+    "session_writes_pending", "Session events waiting to be written to the database"
+)
+
+SessionKey = Tuple[str, str, str]
+# (user_id, session_id, initial state) of a session to create in bulk
+NewSession = Tuple[str, str, Dict[str, Any]]
+
+
+class SessionSummary(NamedTuple):
+    """A session of an app, without its state and events"""
+    user_id: str
+    session_id: str
+    last_update_time: float
+
+
+# ADK's JSON column type holds no state but doesn't say so, which turns off
+# SQLAlchemy's compiled statement cache for every session query
+DynamicJSON.cache_ok = True
+
+
+def create_session_engine(
+    db_url: str,
+    pool_size: int = SESSION_DB_POOL_SIZE,
+    max_overflow: int = SESSION_DB_MAX_OVERFLOW,
+    pool_timeout: float = SESSION_DB_POOL_TIMEOUT,
+    pool_recycle: int = SESSION_DB_POOL_RECYCLE,
+    sqlite_wal: bool = SESSION_SQLITE_WAL,
+) -> Engine:
+    """SQLAlchemy engine with a sized connection pool.
+
+    SQLite databases are shared between threads, and file databases are
+    switched to WAL so readers in other worker processes don't block the
+    writer. Server databases get pre-ping so connections dropped by a load
+    balancer or failover are replaced instead of failing a request.
+    """
+    url = make_url(db_url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=True,
+        )
+
+    in_memory = url.database in (None, "", ":memory:")
+    if in_memory:
+        # One shared connection, otherwise each thread would see its own empty database
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+        )
+
+    @event.listens_for(engine, "connect")
+    def configure_sqlite(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if sqlite_wal and not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        # Deleting a session should also delete its events
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    return engine
+
+
+class PooledDatabaseSessionService(DatabaseSessionService):
+    """ADK's database session service on a pooled, tuned engine"""
+
+    def __init__(self, db_url: str, **engine_options: Any):
+        # DatabaseSessionService.__init__ would build a default engine, so set up its attributes here
+        self.db_engine: Engine = create_session_engine(db_url, **engine_options)
+        self.metadata = MetaData()
+        self.inspector = inspect(self.db_engine)
+        self.DatabaseSessionFactory = sessionmaker(bind=self.db_engine)
+        Base.metadata.create_all(self.db_engine)
+
+    def append_event(self, session: Session, event: Event) -> Event:
+        """Store an event, writing only the state keys it changes.
+
+        DatabaseSessionService rewrites the whole app, user and session state
+        on every event. Here state rows without changes are not touched, and
+        on SQLite and PostgreSQL changed keys are merged in by the database
+        instead of reading and writing back the full JSON.
+        """
+        if event.partial:
+            return event
+
+        state_delta = event.actions.state_delta if event.actions else None
+        app_delta, user_delta, session_delta = _extract_state_delta(state_delta)
+        session_key = (
+            StorageSession.app_name == session.app_name,
+            StorageSession.user_id == session.user_id,
+            StorageSession.id == session.id,
+        )
+
+        with self.DatabaseSessionFactory() as db:
+            update_time = db.execute(select(StorageSession.update_time).where(*session_key)).scalar_one_or_none()
+            if update_time is None:
+                raise ValueError(f"Session {session.id} not found")
+            if update_time.timestamp() > session.last_update_time:
+                raise ValueError(
+                    f"Session last_update_time {session.last_update_time} is later than"
+                    f" the update_time in storage {update_time}"
+                )
+
+            if app_delta:
+                self._update_state(db, StorageAppState, (session.app_name,), app_delta)
+            if user_delta:
+                self._update_state(db, StorageUserState, (session.app_name, session.user_id), user_delta)
+
+            session_values: Dict[str, Any] = {"update_time": func.now()}
+            merged = self._merged_state(StorageSession.state, session_delta) if session_delta else None
+            if merged is not None:
+                session_values["state"] = merged
+            elif session_delta:
+                storage_session = db.get(StorageSession, (session.app_name, session.user_id, session.id))
+                session_values["state"] = {**(storage_session.state or {}), **session_delta}
+            db.execute(update(StorageSession).where(*session_key).values(**session_values))
+
+            db.add(_storage_event(session, event))
+            db.commit()
+            session.last_update_time = db.execute(
+                select(StorageSession.update_time).where(*session_key)
+            ).scalar_one().timestamp()
+
+        # Skip DatabaseSessionService's full rewrite, only update the in-memory session
+        BaseSessionService.append_event(self, session=session, event=event)
+        return event
+
+    def ping(self) -> bool:
+        """Whether the database answers, for readiness checks"""
+        with self.db_engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+
+    def close(self) -> None:
+        self.db_engine.dispose()
+
+    def list_session_summaries(
+        self,
+        app_name: str,
+        user_ids: Optional[Sequence[str]] = None,
+        updated_before: Optional[float] = None,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 100,
+    ) -> List[SessionSummary]:
+        """Sessions of an app ordered by (user_id, session_id), starting after the given key.
+
+        Paging by key rather than offset keeps every page one index range scan.
+        """
+        query = select(StorageSession.user_id, StorageSession.id, StorageSession.update_time).where(
+            *_session_filter(app_name, user_ids, updated_before)
+        )
+        if after is not None:
+            query = query.where(or_(
+                StorageSession.user_id > after[0],
+                and_(StorageSession.user_id == after[0], StorageSession.id > after[1]),
+            ))
+        query = query.order_by(StorageSession.user_id, StorageSession.id).limit(limit)
+        with self.DatabaseSessionFactory() as db:
+            return [
+                SessionSummary(user_id, session_id, _utc_timestamp(update_time))
+                for user_id, session_id, update_time in db.execute(query)
+            ]
+
+    def count_sessions(
+        self, app_name: str, user_ids: Optional[Sequence[str]] = None, updated_before: Optional[float] = None
+    ) -> int:
+        query = select(func.count()).select_from(StorageSession).where(
+            *_session_filter(app_name, user_ids, updated_before)
+        )
+        with self.DatabaseSessionFactory() as db:
+            return db.execute(query).scalar_one()
+
+    def create_sessions(self, app_name: str, sessions: Sequence[NewSession]) -> int:
+        """Create sessions in one transaction, skipping those that already exist.
+
+        Returns the number created. The app: and user: state keys of the
+        batch are merged per user, and new users' state rows inserted with
+        them, instead of one lookup and write per session.
+        """
+        with self.DatabaseSessionFactory() as db:
+            existing = set(db.execute(
+                select(StorageSession.user_id, StorageSession.id).where(
+                    StorageSession.app_name == app_name,
+                    tuple_(StorageSession.user_id, StorageSession.id).in_(
+                        [(user_id, session_id) for user_id, session_id, _ in sessions]
+                    ),
+                )
+            ).all())
+            sessions = [session for session in sessions if (session[0], session[1]) not in existing]
+            if not sessions:
+                return 0
+
+            rows = []
+            app_delta: Dict[str, Any] = {}
+            user_deltas: Dict[str, Dict[str, Any]] = {}
+            for user_id, session_id, state in sessions:
+                session_app_delta, user_delta, session_state = _extract_state_delta(state)
+                app_delta.update(session_app_delta)
+                user_deltas.setdefault(user_id, {}).update(user_delta)
+                rows.append({"app_name": app_name, "user_id": user_id, "id": session_id, "state": session_state})
+
+            if db.get(StorageAppState, app_name) is None:
+                db.add(StorageAppState(app_name=app_name, state={}))
+                db.flush()
+            if app_delta:
+                self._update_state(db, StorageAppState, (app_name,), app_delta)
+            users_with_state = set(db.scalars(
+                select(StorageUserState.user_id).where(
+                    StorageUserState.app_name == app_name, StorageUserState.user_id.in_(user_deltas)
+                )
+            ))
+            # New users' state rows start out with their delta; existing ones are merged into
+            new_users = [
+                {"app_name": app_name, "user_id": user_id, "state": user_delta}
+                for user_id, user_delta in user_deltas.items() if user_id not in users_with_state
+            ]
+            if new_users:
+                db.execute(insert(StorageUserState), new_users)
+            for user_id in users_with_state:
+                if user_deltas[user_id]:
+                    self._update_state(db, StorageUserState, (app_name, user_id), user_deltas[user_id])
+            db.execute(insert(StorageSession), rows)
+            db.commit()
+        return len(rows)
+
+    def delete_sessions(
+        self, app_name: str, keys: Sequence[Tuple[str, str]], updated_before: Optional[float] = None
+    ) -> int:
+        """Delete sessions by (user_id, session_id) in one statement; their events
+        go with them. Sessions updated since updated_before are kept."""
+        if not keys:
+            return 0
+        # One expanding parameter, so the statement is compiled once whatever the batch size
+        condition = tuple_(StorageSession.user_id, StorageSession.id).in_(list(keys))
+        with self.DatabaseSessionFactory() as db:
+            result = db.execute(
+                delete(StorageSession).where(*_session_filter(app_name, None, updated_before), condition)
+            )
+            db.commit()
+        return result.rowcount
+
+    def _update_state(self, db, model, primary_key: Tuple[str, ...], delta: Dict[str, Any]) -> None:
+        """Merge changed keys into an app or user state row"""
+        merged = self._merged_state(model.state, delta)
+        if merged is None:
+            row = db.get(model, primary_key)
+            row.state = {**(row.state or {}), **delta}
+            return
+        key_columns = [column for column in model.__table__.primary_key.columns]
+        db.execute(
+            update(model)
+            .where(*(column == value for column, value in zip(key_columns, primary_key)))
+            .values(state=merged, update_time=func.now())
+        )
+
+    def _merged_state(self, column, delta: Dict[str, Any]):
+        """SQL expression setting the delta's top-level keys in a JSON state column,
+        or None when the database can't do it in place"""
+        dialect = self.db_engine.dialect.name
+        if dialect == "postgresql":
+            return func.coalesce(column, cast("{}", JSONB)).op("||")(literal(delta, JSONB))
+        if dialect == "sqlite" and not any('"' in key for key in delta):
+            arguments = []
+            for key, value in delta.items():
+                arguments += [f'$."{key}"', func.json(json.dumps(value))]
+            return func.json_set(func.coalesce(column, "{}"), *arguments)
+        return None
+
+
+def _session_filter(app_name: str, user_ids: Optional[Sequence[str]], updated_before: Optional[float]) -> list:
+    conditions = [StorageSession.app_name == app_name]
+    if user_ids is not None:
+        conditions.append(StorageSession.user_id.in_(user_ids))
+    if updated_before is not None:
+        # update_time holds the database's CURRENT_TIMESTAMP, naive UTC
+        cutoff = datetime.fromtimestamp(updated_before, timezone.utc).replace(tzinfo=None)
+        conditions.append(StorageSession.update_time < cutoff)
+    return conditions
+
+
+def _utc_timestamp(value: datetime) -> float:
+    """Epoch seconds of a naive UTC update_time, whatever the host's time zone"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _storage_event(session: Session, event: Event) -> StorageEvent:
+    """Database row for an event, encoded the same way as DatabaseSessionService"""
+    storage_event = StorageEvent(
+        id=event.id,
+        invocation_id=event.invocation_id,
+        author=event.author,
+        branch=event.branch,
+        actions=event.actions,
+        session_id=session.id,
+        app_name=session.app_name,
+        user_id=session.user_id,
+        timestamp=datetime.fromtimestamp(event.timestamp),
+        long_running_tool_ids=event.long_running_tool_ids,
+        grounding_metadata=event.grounding_metadata,
+        partial=event.partial,
+        turn_complete=event.turn_complete,
+        error_code=event.error_code,
+        error_message=event.error_message,
+        interrupted=event.interrupted,
+    )
+    if event.content:
+        content = event.content.model_dump(exclude_none=True)
+        for part in content["parts"]:
+            if "inline_data" in part:
+                part["inline_data"]["data"] = (base64.b64encode(part["inline_data"]["data"]).decode("utf-8"),)
+        storage_event.content = content
+    return storage_event
+
+
+class BulkInMemorySessionService(InMemorySessionService):
+    """ADK's in-memory session service with the bulk operations of the database one"""
+
+    def list_session_summaries(
+        self,
+        app_name: str,
+        user_ids: Optional[Sequence[str]] = None,
+        updated_before: Optional[float] = None,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 100,
+    ) -> List[SessionSummary]:
+        summaries = sorted(
+            summary for summary in self._summaries(app_name, user_ids, updated_before)
+            if after is None or (summary.user_id, summary.session_id) > after
+        )
+        return summaries[:limit]
+
+    def count_sessions(
+        self, app_name: str, user_ids: Optional[Sequence[str]] = None, updated_before: Optional[float] = None
+    ) -> int:
+        return sum(1 for _ in self._summaries(app_name, user_ids, updated_before))
+
+    def create_sessions(self, app_name: str, sessions: Sequence[NewSession]) -> int:
+        created = 0
+        for user_id, session_id, state in sessions:
+            if session_id in self.sessions.get(app_name, {}).get(user_id, {}):
+                continue
+            self.create_session(app_name=app_name, user_id=user_id, state=state, session_id=session_id)
+            created += 1
+        return created
+
+    def delete_sessions(
+        self, app_name: str, keys: Sequence[Tuple[str, str]], updated_before: Optional[float] = None
+    ) -> int:
+        deleted = 0
+        app_sessions = self.sessions.get(app_name, {})
+        for user_id, session_id in keys:
+            user_sessions = app_sessions.get(user_id, {})
+            session = user_sessions.get(session_id)
+            if session is None or (updated_before is not None and session.last_update_time >= updated_before):
+                continue
+            del user_sessions[session_id]
+            deleted += 1
+        return deleted
+
+    def _summaries(
+        self, app_name: str, user_ids: Optional[Sequence[str]], updated_before: Optional[float]
+    ):
+        app_sessions = self.sessions.get(app_name, {})
+        for user_id in list(app_sessions) if user_ids is None else user_ids:
+            # Copied, as other requests may add sessions meanwhile
+            for session in list(app_sessions.get(user_id, {}).values()):
+                if updated_before is None or session.last_update_time < updated_before:
+                    yield SessionSummary(user_id, session.id, session.last_update_time)
+
+
+class WriteBehindSessionService(BaseSessionService):
+    """Keeps hot sessions in memory and writes their events to the database
+    from a background thread.
+
+    Turns read the session from the cache and only enqueue new events, so
+    the request path never waits on the database. Sessions with pending
+    writes stay cached, so a cache miss can read the database right away;
+    deleting a session drops its queued events and only waits for a write
+    already in progress. ADK calls these methods from its async routes, so
+    nothing here blocks on the write queue.
+
+    Entries expire after `ttl` seconds so sessions updated by other workers
+    are reloaded, and a write that conflicts with another worker is retried
+    on the fresh row. Until then each worker serves its own copy, so several
+    workers need requests for a session routed to the same worker.
+    """
+
+    def __init__(
+        self,
+        inner: DatabaseSessionService,
+        max_sessions: int = SESSION_CACHE_SIZE,
+        ttl: float = SESSION_CACHE_TTL,
+    ):
+        self.inner = inner
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._cache: "OrderedDict[SessionKey, Tuple[float, Session]]" = OrderedDict()
+        self._pending: Dict[SessionKey, int] = {}
+        # Bumped when a session with pending writes is deleted, so its queued events are dropped
+        self._generations: Dict[SessionKey, int] = {}
+        # Session the writer thread is writing an event for, if any
+        self._writing: Optional[SessionKey] = None
+        self._condition = threading.Condition()
+        self._queue: "queue.Queue[Optional[Tuple[SessionKey, int, Event]]]" = queue.Queue()
+        # Database-side copies of cached sessions; only used by the writer thread
+        self._shadows: Dict[SessionKey, Session] = {}
+        self._writer = threading.Thread(target=self._write_loop, name="session-write-behind", daemon=True)
+        self._writer.start()
+
+    def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session = self.inner.create_session(app_name=app_name, user_id=user_id, state=state, session_id=session_id)
+        self._remember(session)
+        return copy.deepcopy(session)
+
+    def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        if config is None:
+            cached = self._cached(key)
+            if cached is not None:
+                SESSION_CACHE_REQUESTS.inc(result="hit")
+                return copy.deepcopy(cached)
+            SESSION_CACHE_REQUESTS.inc(result="miss")
+        else:
+            # Only these reads can miss queued events; ADK's own routes never pass a config
+            self._wait_for_writes(key)
+
+        session = self.inner.get_session(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+        if session is not None and config is None:
+            self._remember(session)
+            return copy.deepcopy(session)
+        return session
+
+    def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        return self.inner.list_sessions(app_name=app_name, user_id=user_id)
+
+    def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._discard([(app_name, user_id, session_id)])
+        self.inner.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    def list_events(self, *, app_name: str, user_id: str, session_id: str) -> ListEventsResponse:
+        return self.inner.list_events(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    def list_session_summaries(self, app_name: str, **filters: Any) -> List[SessionSummary]:
+        return self.inner.list_session_summaries(app_name, **filters)
+
+    def count_sessions(self, app_name: str, **filters: Any) -> int:
+        return self.inner.count_sessions(app_name, **filters)
+
+    def create_sessions(self, app_name: str, sessions: Sequence[NewSession]) -> int:
+        # Not cached; the first turn of each session loads it
+        return self.inner.create_sessions(app_name, sessions)
+
+    def delete_sessions(
+        self, app_name: str, keys: Sequence[Tuple[str, str]], updated_before: Optional[float] = None
+    ) -> int:
+        self._discard([(app_name, user_id, session_id) for user_id, session_id in keys])
+        return self.inner.delete_sessions(app_name, keys, updated_before)
+
+    def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        super().append_event(session=session, event=event)
+        key = (session.app_name, session.user_id, session.id)
+        with self._condition:
+            self._store(key, session)
+            self._pending[key] = self._pending.get(key, 0) + 1
+            generation = self._generations.get(key, 0)
+        self._queue.put((key, generation, event))
+        SESSION_WRITES_PENDING.inc()
+        return event
+
+    def ping(self) -> bool:
+        return self.inner.ping() and self._writer.is_alive()
+
+    def flush(self) -> None:
+        """Block until every queued event has been written"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Write the queued events, then stop the writer thread"""
+        self._queue.put(None)
+        self._writer.join()
+        close = getattr(self.inner, "close", None)
+        if close is not None:
+            close()
+
+    def _cached(self, key: SessionKey) -> Optional[Session]:
+        with self._condition:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, session = entry
+            # Sessions with unwritten events stay valid, the cache is the newest copy
+            if expires_at < time.monotonic() and not self._pending.get(key):
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return session
+
+    def _remember(self, session: Session) -> None:
+        with self._condition:
+            self._store((session.app_name, session.user_id, session.id), session)
+
+    def _store(self, key: SessionKey, session: Session) -> None:
+        self._cache[key] = (time.monotonic() + self.ttl, session)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_sessions:
+            oldest = next(iter(self._cache))
+            if self._pending.get(oldest):
+                # Can't drop the only up-to-date copy yet
+                break
+            self._cache.popitem(last=False)
+
+    def _wait_for_writes(self, key: SessionKey) -> None:
+        with self._condition:
+            while self._pending.get(key):
+                self._condition.wait()
+
+    def _discard(self, keys: Sequence[SessionKey]) -> None:
+        """Forget sessions about to be deleted, dropping their queued events"""
+        with self._condition:
+            for key in keys:
+                self._cache.pop(key, None)
+                if self._pending.get(key):
+                    self._generations[key] = self._generations.get(key, 0) + 1
+            # An event being written now could land after the delete
+            while self._writing in keys:
+                self._condition.wait()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                key, generation, event = item
+                with self._condition:
+                    current = self._generations.get(key, 0) == generation
+                    if current:
+                        self._writing = key
+                if current:
+                    self._write(key, event)
+                else:
+                    # The session was deleted after this event was queued
+                    self._shadows.pop(key, None)
+            finally:
+                self._queue.task_done()
+                if item is not None:
+                    self._written(item[0])
+
+    def _write(self, key: SessionKey, event: Event) -> None:
+        for attempt in range(2):
+            shadow = self._shadows.get(key)
+            if shadow is None:
+                app_name, user_id, session_id = key
+                shadow = self.inner.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+                if shadow is None:
+                    logger.warning("Dropping event %s for deleted session %s", event.id, key[2])
+                    return
+                shadow.events = []
+                self._shadows[key] = shadow
+            try:
+                self.inner.append_event(shadow, event)
+                # The shadow only tracks the row's update time, not the history
+                shadow.events.clear()
+                return
+            except ValueError:
+                # Another worker wrote to the session since it was loaded
+                self._shadows.pop(key, None)
+                self._expire(key)
+                if attempt:
+                    logger.exception("Failed to write event %s for session %s", event.id, key[2])
+                    return
+                logger.warning("Session %s changed in another worker, retrying write", key[2])
+            except Exception:
+                self._shadows.pop(key, None)
+                logger.exception("Failed to write event %s for session %s", event.id, key[2])
+                return
+
+    def _expire(self, key: SessionKey) -> None:
+        # Kept while it has pending writes (it holds their events), reloaded after that
+        with self._condition:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache[key] = (0.0, entry[1])
+
+    def _written(self, key: SessionKey) -> None:
+        SESSION_WRITES_PENDING.dec()
+        with self._condition:
+            self._writing = None
+            remaining = self._pending.get(key, 1) - 1
+            if remaining:
+                self._pending[key] = remaining
+            else:
+                self._pending.pop(key, None)
+                self._generations.pop(key, None)
+                if key not in self._cache:
+                    self._shadows.pop(key, None)
+            self._condition.notify_all()
+
+
+def create_session_service(
+    db_url: str = SESSION_DB_URL, cache_size: int = SESSION_CACHE_SIZE, cache_ttl: float = SESSION_CACHE_TTL
+) -> BaseSessionService:
+    """Session service for the configured database, optionally behind the write-behind cache"""
+    if not db_url:
+        return BulkInMemorySessionService()
+    service = PooledDatabaseSessionService(db_url)
+    logger.info("Storing sessions in %s", make_url(db_url).render_as_string(hide_password=True))
+    if cache_size > 0:
+        return WriteBehindSessionService(service, max_sessions=cache_size, ttl=cache_ttl)
+    return service
+
+
+def use_session_service(service: BaseSessionService) -> None:
+    """Make get_fast_api_app() serve sessions from this service.
+
+    get_fast_api_app() builds its session service internally and only takes
+    a URL, so the in-memory default it would construct is replaced instead.
+    Call this before get_fast_api_app() without a session_db_url.
+    """
+    fast_api.InMemorySessionService = lambda: service
@@ -0,0 +1,93 @@
+import os
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+# UI redraws per second while a response is streaming
+STREAM_MAX_FPS = float(os.environ.get("STREAM_MAX_FPS", 20))
+STREAM_REDRAW_INTERVAL = 1.0 / max(STREAM_MAX_FPS, 1.0)
+
+
+class SseEvent(NamedTuple):
+    """A single dispatched server-sent event"""
+    data: str
+    event: str = "message"
+    id: Optional[str] = None
+    retry: Optional[int] = None
+
+
+def iter_sse_events(lines: Iterable[Union[bytes, str]]) -> Iterator[SseEvent]:
+    """Parse an SSE line stream (e.g. response.iter_lines()) into events.
+
+    Follows the event-stream format: multi-line data fields are joined with
+    newlines, comments are skipped, the last seen id carries over to later
+    events, and an unterminated event at end of stream is dropped.
+    """
+    data_lines: List[str] = []
+    event_type = ""
+    last_id: Optional[str] = None
+    retry: Optional[int] = None
+
+    for raw_line in lines:
+        line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+
+        # A blank line dispatches the buffered event
+        if not line:
+            if data_lines:
+                yield SseEvent("\n".join(data_lines), event_type or "message", last_id, retry)
+            data_lines = []
+            event_type = ""
+            retry = None
+            continue
+
+        if line.startswith(":"):
+            continue
+
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+
+        if field == "data":
+            data_lines.append(value)
+        elif field == "event":
+            event_type = value
+        elif field == "id":
+            if "\0" not in value:
+                last_id = value
+        elif field == "retry":
+            if value.isdigit():
+                retry = int(value)
+
+
+class StreamBuffer:
+    """Accumulates the text of streamed agent events.
+
+    Partial events carry text deltas and are appended to the part currently
+    being streamed; the final, non-partial event for that part carries the
+    full text and replaces the deltas.
+    """
+
+    def __init__(self):
+        self._committed = ""
+        self._partial: List[str] = []
+
+    @property
+    def text(self) -> str:
+        if self._committed and self._partial:
+            return self._committed + "\n\n" + "".join(self._partial)
+        return self._committed + "".join(self._partial)
+
+    def feed(self, event: Dict[str, Any]) -> bool:
+        """Add the text parts of one ADK event, returning whether the text changed"""
+        content = event.get("content") or {}
+        texts = [part["text"] for part in content.get("parts", []) if "text" in part]
+        if not texts:
+            return False
+
+        if event.get("partial"):
+            self._partial.extend(texts)
+        else:
+            self._partial = []
+            if self._committed:
+                self._committed += "\n\n"
+            self._committed += "".join(texts)
+        return True
+
@@ -0,0 +1,161 @@
+"""Offline, deterministic model backend for local and CI performance testing.
+
+Select it with ADK_MODEL=stub (or stub-<profile>, e.g. stub-realistic). It
+answers from a script instead of calling an API:
+
+- After a tool has run, it reports the tool's response as text.
+- Otherwise the last user message is matched against the script rules in
+  order; a rule either replies with text or calls one of the tools offered
+  in the request.
+- Without a match it echoes the message back.
+
+A script file (STUB_LLM_SCRIPT) is a JSON list of rules such as
+    {"match": "weather in (?P<city>\\\\w+)", "call": {"name": "get_weather", "args": {"city": "{city}"}}}
+    {"match": "hello", "text": "Hi there!"}
+where named groups from the regex can be used in args and text, and a
+rule's "defaults" supply values for groups that did not match.
+
+Latency profiles set the delay before the first token and the token rate
+of streamed answers; STUB_LLM_LATENCY_MS and STUB_LLM_TOKENS_PER_SEC
+override the profile.
+"""
+import asyncio
+import json
+import os
+import re
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from google.adk.models import BaseLlm, LLMRegistry, LlmRequest, LlmResponse
+from google.genai import types
+
+# Named latency profiles: (milliseconds to first token, tokens per second; 0 = unlimited)
+PROFILES: Dict[str, Tuple[float, float]] = {
+    "instant": (0, 0),
+    "fast": (50, 200),
+    "realistic": (400, 60),
+    "slow": (1500, 20),
+}
+
+# Words per streamed chunk
+STUB_LLM_CHUNK_TOKENS = int(os.environ.get("STUB_LLM_CHUNK_TOKENS", 1))
+
+# Rules used when no script file is configured, covering the sample agent's tools
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {
+        "match": r"weather(?: in (?P<city>[A-Za-z ]+))?",
+        "call": {"name": "get_weather", "args": {"city": "{city}"}},
+        "defaults": {"city": "London"},
+    },
+    {"match": r"\bupgrade\b", "call": {"name": "upgrade_user_plan", "args": {}}},
+    {"match": r"\bplan\b", "call": {"name": "retrieve_user_plan", "args": {}}},
+    {"match": r"\bsupport\b|\bhelp\b", "call": {"name": "send_support_link", "args": {}}},
+    {"match": r"\btime\b", "call": {"name": "get_current_time", "args": {}}},
+]
+
+
+def load_rules(path: Optional[str]) -> List[Dict[str, Any]]:
+    """Load script rules from a JSON file, or fall back to the default rules"""
+    if not path:
+        return DEFAULT_RULES
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def _last_content(llm_request: LlmRequest) -> Optional[types.Content]:
+    return llm_request.contents[-1] if llm_request.contents else None
+
+
+def _last_user_text(llm_request: LlmRequest) -> str:
+    for content in reversed(llm_request.contents):
+        if content.role == "user":
+            texts = [part.text for part in content.parts or [] if part.text]
+            if texts:
+                return "".join(texts)
+    return ""
+
+
+def _fill(value: Any, groups: Dict[str, str]) -> Any:
+    """Substitute {group} placeholders from a regex match into a rule value"""
+    if isinstance(value, str):
+        return value.format_map(groups)
+    if isinstance(value, dict):
+        return {key: _fill(item, groups) for key, item in value.items()}
+    return value
+
+
+class StubLlm(BaseLlm):
+    """Scripted local model with configurable latency, for runs without an API"""
+
+    model: str = "stub"
+    latency_ms: float = 0
+    tokens_per_second: float = 0
+    chunk_tokens: int = STUB_LLM_CHUNK_TOKENS
+    rules: List[Dict[str, Any]] = DEFAULT_RULES
+
+    def __init__(self, **data: Any):
+        super().__init__(**data)
+        profile = self.model.partition("-")[2]
+        latency_ms, tokens_per_second = PROFILES.get(profile, (self.latency_ms, self.tokens_per_second))
+        self.latency_ms = float(os.environ.get("STUB_LLM_LATENCY_MS", latency_ms))
+        self.tokens_per_second = float(os.environ.get("STUB_LLM_TOKENS_PER_SEC", tokens_per_second))
+        if "rules" not in data:
+            self.rules = load_rules(os.environ.get("STUB_LLM_SCRIPT"))
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [r"stub.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        text, function_call = self._respond(llm_request)
+        if function_call is not None:
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=function_call)]))
+            return
+
+        if stream:
+            words = text.split(" ")
+            for start in range(0, len(words), self.chunk_tokens):
+                chunk = " ".join(words[start:start + self.chunk_tokens])
+                if start:
+                    chunk = " " + chunk
+                if self.tokens_per_second:
+                    await asyncio.sleep(self.chunk_tokens / self.tokens_per_second)
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=chunk)]),
+                    partial=True,
+                )
+        elif self.tokens_per_second:
+            await asyncio.sleep(len(text.split(" ")) / self.tokens_per_second)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+    def _respond(self, llm_request: LlmRequest) -> Tuple[str, Optional[types.FunctionCall]]:
+        """Pick the scripted reply: a text answer or a function call"""
+        last = _last_content(llm_request)
+        responses = [part.function_response for part in (last.parts if last else None) or [] if part.function_response]
+        if responses:
+            return " ".join(
+                f"{response.name} returned {json.dumps(response.response, default=str)}." for response in responses
+            ), None
+
+        user_text = _last_user_text(llm_request)
+        for rule in self.rules:
+            match = re.search(rule["match"], user_text, re.IGNORECASE)
+            if not match:
+                continue
+            groups = dict(rule.get("defaults", {}))
+            groups.update({name: text.strip() for name, text in match.groupdict().items() if text})
+            if "call" in rule:
+                name = rule["call"]["name"]
+                if name not in llm_request.tools_dict:
+                    return f"The {name} tool is not available on your current plan.", None
+                return "", types.FunctionCall(name=name, args=_fill(rule["call"].get("args", {}), groups))
+            return _fill(rule.get("text", ""), groups), None
+
+        return f"You said: {user_text}", None
+
+
+LLMRegistry.register(StubLlm)
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from server_metrics import counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+# Pipeline defaults, overridable through the environment
+WEBHOOK_QUEUE_SIZE = int(os.environ.get("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", 4))
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", 50))
+WEBHOOK_BATCH_WINDOW = float(os.environ.get("WEBHOOK_BATCH_WINDOW", 0.25))
+WEBHOOK_DEDUP_SIZE = int(os.environ.get("WEBHOOK_DEDUP_SIZE", 10000))
+WEBHOOK_DEDUP_TTL = float(os.environ.get("WEBHOOK_DEDUP_TTL", 600))
+
+WEBHOOK_DELIVERIES = counter(
+    "webhook_deliveries_total", "Webhook deliveries by outcome", ["outcome"]
+)
+WEBHOOK_QUEUE_DEPTH = gauge("webhook_queue_depth", "Webhook deliveries waiting to be processed")
+WEBHOOK_EVENTS_PROCESSED = counter(
+    "webhook_events_processed_total", "Webhook events handled by the workers", ["status"]
+)
+WEBHOOK_BATCH_LATENCY = histogram(
+    "webhook_batch_duration_seconds", "Time spent handling one batch of webhook events"
+)
+
+# Async callable receiving a batch key and the parsed events for it
+BatchHandler = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
+
+class DeliveryDeduper:
+    """LRU of recently seen delivery ids that expire after a TTL"""
+
+    def __init__(self, max_size: int = WEBHOOK_DEDUP_SIZE, ttl: float = WEBHOOK_DEDUP_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def __contains__(self, delivery_id: str) -> bool:
+        expires_at = self._seen.get(delivery_id)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._seen[delivery_id]
+            return False
+        self._seen.move_to_end(delivery_id)
+        return True
+
+    def add(self, delivery_id: str) -> None:
+        self._seen[delivery_id] = time.monotonic() + self.ttl
+        self._seen.move_to_end(delivery_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+
+def delivery_id_for(headers, body: bytes) -> str:
+    """Delivery id from the standard webhook-id header, or a hash of the body"""
+    return headers.get("webhook-id") or hashlib.sha256(body).hexdigest()
+
+
+def batch_key(event: Dict[str, Any]) -> str:
+    """Group events by the user or session they belong to"""
+    data = event.get("data") if isinstance(event.get("data"), dict) else {}
+    for source in (event, data):
+        for field in ("user_id", "session_id", "connection_id"):
+            if source.get(field):
+                return f"{field}:{source[field]}"
+    return "unknown"
+
+
+async def log_webhook_batch(key: str, events: List[Dict[str, Any]]) -> None:
+    """Default batch handler: log the events"""
+    logger.info("Processing %d webhook events for %s", len(events), key)
+    if logger.isEnabledFor(logging.DEBUG):
+        for event in events:
+            logger.debug("Webhook body: %s", event)
+
+
+class WebhookPipeline:
+    """Bounded queue feeding a pool of workers that handle webhooks in batches.
+
+    submit() only enqueues the raw body, so acknowledging a delivery costs
+    the same however slow the batch handler is. When the queue is full it
+    raises asyncio.QueueFull and the caller should ask the sender to retry.
+    """
+
+    def __init__(
+        self,
+        handler: BatchHandler = log_webhook_batch,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        workers: int = WEBHOOK_WORKERS,
+        batch_size: int = WEBHOOK_BATCH_SIZE,
+        batch_window: float = WEBHOOK_BATCH_WINDOW,
+        deduper: Optional[DeliveryDeduper] = None,
+    ):
+        self.handler = handler
+        self.queue_size = queue_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.deduper = deduper or DeliveryDeduper()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start the workers on the running event loop, if not already running"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Finish the queued deliveries, then stop the workers"""
+        if not self._tasks:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, delivery_id: str, body: bytes) -> str:
+        """Queue a delivery, returning "received" or "duplicate" """
+        self.start()
+        if delivery_id in self.deduper:
+            WEBHOOK_DELIVERIES.inc(outcome="duplicate")
+            return "duplicate"
+        try:
+            self._queue.put_nowait(body)
+        except asyncio.QueueFull:
+            WEBHOOK_DELIVERIES.inc(outcome="rejected")
+            raise
+        # Only remember deliveries that were accepted, so rejected ones can be retried
+        self.deduper.add(delivery_id)
+        WEBHOOK_DELIVERIES.inc(outcome="received")
+        WEBHOOK_QUEUE_DEPTH.set(self._queue.qsize())
+        return "received"
+
+    async def _work(self) -> None:
+        while True:
+            bodies = await self._next_batch()
+            try:
+                await self._handle(bodies)
+            finally:
+                for _ in bodies:
+                    self._queue.task_done()
+                WEBHOOK_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _next_batch(self) -> List[bytes]:
+        """Wait for one delivery, then gather more for up to the batch window"""
+        bodies = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(bodies) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                bodies.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return bodies
+
+    async def _handle(self, bodies: List[bytes]) -> None:
+        groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for body in bodies:
+            try:
+                event = json.loads(body)
+            except json.JSONDecodeError:
+                WEBHOOK_EVENTS_PROCESSED.inc(status="invalid")
+                logger.warning("Dropping webhook delivery with invalid JSON body")
+                continue
+            if not isinstance(event, dict):
+                event = {"payload": event}
+            groups[batch_key(event)].append(event)
+
+        for key, events in groups.items():
+            with WEBHOOK_BATCH_LATENCY.time():
+                try:
+                    await self.handler(key, events)
+                    WEBHOOK_EVENTS_PROCESSED.inc(len(events), status="ok")
+                except Exception:
+                    WEBHOOK_EVENTS_PROCESSED.inc(len(events), status="error")
+                    logger.exception("Webhook batch handler failed for %s", key)